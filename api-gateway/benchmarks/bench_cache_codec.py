@@ -0,0 +1,116 @@
+"""
+Encode/decode benchmark for the Redis cache codecs
+
+Runs in-process (no gateway or Redis needed). Encodes and decodes a set of
+products in the cached entry shape with every serializer/compression
+combination available here, both one product per payload (how the catalog
+stores them) and as a single list payload, and reports time per operation
+and bytes stored per product. The legacy text JSON of the product dict is
+included as the baseline.
+
+Usage:
+    python benchmarks/bench_cache_codec.py --products 1000 --rounds 20
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache_codec import CacheCodec, available_formats  # noqa: E402
+from catalog import Product, product_to_entry  # noqa: E402
+
+
+def make_products(count: int) -> List[Dict[str, Any]]:
+    """Synthetic products shaped like a /products response entry"""
+    rng = random.Random(42)
+    products = []
+    for i in range(count):
+        price = round(rng.uniform(1, 2000), 2)
+        products.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "sku": f"SKU-{i:06d}",
+            "name": f"Product {i} " + rng.choice(["Laptop", "Desk Chair", "Mechanical Keyboard", "Monitor"]),
+            "stock_level": rng.randint(0, 500),
+            "price": price,
+            "discounted_price": price * 0.9
+        })
+    return products
+
+
+def timed(fn: Callable[[], Any], rounds: int) -> float:
+    """Best-of-rounds wall time of fn() in seconds"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(label: str, count: int, encode_s: float, decode_s: float, total_bytes: int) -> None:
+    print(f"  {label:<22} encode {encode_s / count * 1e6:7.2f} us  "
+          f"decode {decode_s / count * 1e6:7.2f} us  "
+          f"{total_bytes / count:8.1f} bytes/product")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    entries = [
+        product_to_entry(Product(p["id"], p["sku"], p["name"], p["stock_level"], Decimal(str(p["price"]))))
+        for p in products
+    ]
+    serializers, compressions = available_formats()
+    count = len(products)
+
+    print(f"{count} products, best of {args.rounds} rounds")
+    print("per-product payloads:")
+    blobs = [json.dumps(product) for product in products]
+    report(
+        "legacy json text",
+        count,
+        timed(lambda: [json.dumps(product) for product in products], args.rounds),
+        timed(lambda: [json.loads(blob) for blob in blobs], args.rounds),
+        sum(len(blob.encode()) for blob in blobs)
+    )
+    for serializer in serializers:
+        for compression in compressions:
+            # Threshold 0 forces compression so its cost is visible
+            codec = CacheCodec(serializer, compression, compress_min_bytes=0)
+            encoded = [codec.encode(entry) for entry in entries]
+            report(
+                f"{serializer}+{compression}",
+                count,
+                timed(lambda: [codec.encode(entry) for entry in entries], args.rounds),
+                timed(lambda: [codec.decode(blob) for blob in encoded], args.rounds),
+                sum(len(blob) for blob in encoded)
+            )
+
+    print("single list payload:")
+    for serializer in serializers:
+        for compression in compressions:
+            codec = CacheCodec(serializer, compression, compress_min_bytes=0)
+            encoded_list = codec.encode(entries)
+            report(
+                f"{serializer}+{compression}",
+                count,
+                timed(lambda: codec.encode(entries), args.rounds),
+                timed(lambda: codec.decode(encoded_list), args.rounds),
+                len(encoded_list)
+            )
+
+
+if __name__ == "__main__":
+    main()
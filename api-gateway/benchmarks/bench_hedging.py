@@ -0,0 +1,135 @@
+"""
+Tail latency of downstream GETs with and without request hedging
+
+Starts two local stub services in-process. Each answers after --fast-ms,
+except that a --slow-rate share of requests (a stalled pod, a GC pause)
+take --slow-ms. The same request stream goes through downstream.Downstream
+twice over both endpoints: once single-shot, once with a HedgePolicy. Both
+use the production AdaptiveTimeout defaults, so the script also shows how
+hedging interacts with the timeout. It reports latency percentiles, failed
+requests, the timeout the run ended with and the extra load the hedges
+added.
+
+Usage:
+    python benchmarks/bench_hedging.py --requests 2000 --concurrency 4 --slow-rate 0.03
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from downstream import AdaptiveTimeout, Downstream, HedgePolicy, ServicePool  # noqa: E402
+
+BODY = b'{"status":"healthy"}'
+
+
+async def start_stub(fast_ms: float, slow_ms: float, slow_rate: float) -> asyncio.AbstractServer:
+    """Minimal keep-alive HTTP/1.1 server with a bimodal response time"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                slow = random.random() < slow_rate
+                await asyncio.sleep((slow_ms if slow else fast_ms * random.uniform(0.8, 1.2)) / 1000)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                    b"content-length: %d\r\n\r\n%s" % (len(BODY), BODY)
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def run(name: str, endpoints: List[str], hedging: Optional[HedgePolicy], args) -> None:
+    downstream = Downstream(
+        name, endpoints, AdaptiveTimeout(),
+        hedging=hedging, pool=ServicePool(max_connections=args.concurrency * 4)
+    )
+    latencies: List[float] = []
+    errors = 0
+    remaining = args.requests
+
+    downstream.start()
+    try:
+        # Warm up the latency window the timeout and hedge delay come from
+        for _ in range(args.warmup):
+            try:
+                await downstream.get("/health")
+            except httpx.HTTPError:
+                pass
+        calls_before = downstream.calls
+
+        async def worker() -> None:
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    await downstream.get("/health")
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await downstream.close()
+
+    extra = (downstream.calls - calls_before) / len(latencies) - 1
+    print(f"  {name:<12} p50 {percentile(latencies, 50):7.1f} ms  p95 {percentile(latencies, 95):7.1f} ms  "
+          f"p99 {percentile(latencies, 99):7.1f} ms  max {max(latencies):7.1f} ms  "
+          f"extra load {extra * 100:5.1f}%  {len(latencies) / elapsed:7.0f} req/s")
+    print(f"  {'':<12} failed {errors}, timeout at end {downstream.timeout.current() * 1000:.0f} ms")
+    if hedging:
+        stats = hedging.stats()
+        print(f"  {'':<12} hedges {stats['hedges']}, won {stats['hedge_wins']}, "
+              f"denied by budget {stats['denied_by_budget']}")
+
+
+async def main_async(args) -> None:
+    servers = [await start_stub(args.fast_ms, args.slow_ms, args.slow_rate) for _ in range(2)]
+    endpoints = [f"http://127.0.0.1:{s.sockets[0].getsockname()[1]}" for s in servers]
+    print(f"{args.requests} GETs at concurrency {args.concurrency}; stubs answer in {args.fast_ms:g} ms, "
+          f"{args.slow_rate:.1%} take {args.slow_ms:g} ms")
+    try:
+        await run("single-shot", endpoints, None, args)
+        await run("hedged", endpoints, HedgePolicy(percentile=args.percentile, budget_percent=args.budget), args)
+    finally:
+        for server in servers:
+            server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--fast-ms", type=float, default=5.0)
+    parser.add_argument("--slow-ms", type=float, default=200.0)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--percentile", type=float, default=95.0, help="hedge after this latency percentile")
+    parser.add_argument("--budget", type=float, default=5.0, help="max hedges, percent of requests")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Allocation and throughput of a 1,000-row product response
+
+Runs in-process (no gateway needed). Builds the same /products-shaped
+response from 1,000 rows three ways:
+
+  dicts+fastapi   per-row dicts through a Dict[str, Any] response_model and
+                  jsonable_encoder (how the gateway used to respond)
+  dicts+orjson    per-row dicts with native values, encoded by orjson
+  slots+model     catalog.Product slots objects validated into
+                  ProductListResponse and serialized by pydantic-core
+
+and reports bytes held per product object, peak traced allocation per
+response and responses per second. Rows are dicts standing in for
+asyncpg.Record, which is accessed the same way.
+
+Usage:
+    python benchmarks/bench_product_models.py --rows 1000 --iterations 50
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import DISCOUNT_RATE, Product  # noqa: E402
+from main import ProductListResponse  # noqa: E402
+from serialization import dumps  # noqa: E402
+
+
+def make_rows(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": uuid.uuid4(),
+            "sku": f"SKU-{i:06d}",
+            "name": f"Product {i}",
+            "stock_level": i % 500,
+            "price": Decimal("19.99") + i
+        }
+        for i in range(count)
+    ]
+
+
+def row_to_dict(p: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": p["id"],
+        "sku": p["sku"],
+        "name": p["name"],
+        "stock_level": p["stock_level"],
+        "price": p["price"],
+        "discounted_price": p["price"] * DISCOUNT_RATE
+    }
+
+
+def envelope(products: List[Any]) -> Dict[str, Any]:
+    return {
+        "products": products,
+        "next_cursor": None,
+        "stale": False,
+        "timestamp": datetime.utcnow()
+    }
+
+
+def object_bytes(obj: Any) -> int:
+    """Shallow size of one product representation plus its container"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sys.getsizeof(obj["discounted_price"])
+    return size
+
+
+def measure(name: str, build: Callable[[], bytes], iterations: int, per_product: int) -> None:
+    build()
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build()
+    elapsed = time.perf_counter() - start
+
+    print(f"  {name:<16} {per_product:>6} B/product  peak {peak / 1024:8.1f} KiB  "
+          f"{iterations / elapsed:8.1f} responses/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    dict_model = TypeAdapter(Dict[str, Any])
+
+    def dicts_fastapi() -> bytes:
+        content = dict_model.validate_python(envelope([row_to_dict(p) for p in rows]))
+        return JSONResponse(jsonable_encoder(content)).body
+
+    def dicts_orjson() -> bytes:
+        return dumps(envelope([row_to_dict(p) for p in rows]))
+
+    def slots_model() -> bytes:
+        products = [Product.from_record(p) for p in rows]
+        return ProductListResponse(**envelope(products)).model_dump_json().encode()
+
+    print(f"{args.rows} rows, {args.iterations} responses per variant")
+    measure("dicts+fastapi", dicts_fastapi, args.iterations, object_bytes(row_to_dict(rows[0])))
+    measure("dicts+orjson", dicts_orjson, args.iterations, object_bytes(row_to_dict(rows[0])))
+    measure("slots+model", slots_model, args.iterations, object_bytes(Product.from_record(rows[0])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+CPU cost of a /products cache hit: re-parsed dict vs pre-encoded bytes
+
+Runs in-process (no gateway, Redis or PostgreSQL needed). For pages of
+several sizes it compares what a hit used to cost - json.loads of the
+cached text, FastAPI's response_model validation, jsonable_encoder and
+JSONResponse rendering - with what it costs now: wrapping the cached bytes
+in a Response. Reports CPU microseconds per hit and the speedup.
+
+Usage:
+    python benchmarks/bench_products_hit_cpu.py --hits 5000 --sizes 10,100
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_cache_codec import make_products  # noqa: E402
+from main import encoded_response, strong_etag  # noqa: E402
+
+
+def cpu_per_call(fn: Callable[[], Any], calls: int) -> float:
+    """Process CPU time per call in microseconds"""
+    fn()
+    start = time.process_time()
+    for _ in range(calls):
+        fn()
+    return (time.process_time() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hits", type=int, default=5000)
+    parser.add_argument("--sizes", default="10,100")
+    args = parser.parse_args()
+
+    response_model = TypeAdapter(Dict[str, Any])
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        page = {
+            "products": make_products(size),
+            "next_cursor": "eyJzIjoiU0tVLTAwMDAxMCJ9",
+            "stale": False,
+            "timestamp": "2025-10-18T03:27:07.000000"
+        }
+        cached_text = json.dumps(page)
+        body = cached_text.encode()
+        etag = strong_etag(body)
+
+        def reparse_hit():
+            result = json.loads(cached_text)
+            validated = response_model.validate_python(result)
+            return JSONResponse(content=jsonable_encoder(validated))
+
+        def bytes_hit():
+            return encoded_response(body, etag, "HIT")
+
+        assert reparse_hit().body == JSONResponse(content=page).body
+
+        before = cpu_per_call(reparse_hit, args.hits)
+        after = cpu_per_call(bytes_hit, args.hits)
+        print(f"page size {size:>4} ({len(body):,} bytes)  "
+              f"re-parse {before:8.1f} us/hit  pre-encoded {after:6.1f} us/hit  "
+              f"{before / after:6.1f}x less CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Concurrent latency benchmark for GET /products
+
+Fires a fixed number of requests at a running gateway with bounded
+concurrency and reports latency percentiles. Run it once against the
+previous build and once against the current one to compare.
+
+Usage:
+    python benchmarks/bench_products_latency.py --url http://localhost:8000 \
+        --concurrency 50 --requests 2000 --limit 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted sample list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run(url: str, path: str, concurrency: int, total: int) -> None:
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        # Warm up connections and the cache before measuring
+        await client.get(path)
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"GET {path}  concurrency={concurrency}  requests={total}  errors={errors}")
+    print(f"  throughput: {total / elapsed:,.0f} req/s")
+    print(f"  mean:       {statistics.mean(latencies):.2f} ms")
+    for pct in (50, 90, 99):
+        print(f"  p{pct}:        {percentile(latencies, pct):.2f} ms")
+    print(f"  max:        {max(latencies):.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, f"/products?limit={args.limit}", args.concurrency, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Round-trip benchmark for Redis command batching
+
+Simulates concurrent requests issuing the gateway's multi-command cache
+patterns (the /test-redis SETEX/GET/TTL trio and a 10-product page read)
+directly against Redis, in three modes: one round-trip per command,
+one pipeline per request, and auto-batching across requests. Reports
+round-trips per request and Redis commands per second for each.
+
+Usage:
+    python benchmarks/bench_redis_batching.py --redis redis://localhost:6379 \
+        --concurrency 50 --requests 5000
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import redis.asyncio as aioredis
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import RedisBatcher  # noqa: E402
+
+PAGE_SIZE = 10
+
+
+def request_commands(n: int) -> List[Tuple[Any, ...]]:
+    """Commands one simulated request issues (alternating the two patterns)"""
+    if n % 2 == 0:
+        key = f"bench:batching:{n}"
+        return [("SETEX", key, 60, "value"), ("GET", key), ("TTL", key)]
+    return [("HGETALL", f"bench:batching:item:{(n + i) % 100}") for i in range(PAGE_SIZE)]
+
+
+async def run_mode(client: aioredis.Redis, mode: str, concurrency: int, total: int) -> None:
+    batcher = RedisBatcher(client, auto_batch=mode == "auto")
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            commands = request_commands(remaining)
+            if mode == "unbatched":
+                for command in commands:
+                    await batcher.execute(command)
+            else:
+                await batcher.execute(*commands)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await batcher.close()
+
+    stats = batcher.stats()
+    print(f"{mode:<10} round-trips/request={stats['round_trips'] / total:6.3f}  "
+          f"commands/round-trip={stats['commands_per_round_trip']:6.1f}  "
+          f"requests/s={total / elapsed:9,.0f}  ops/s={stats['commands'] / elapsed:10,.0f}")
+
+
+async def run(redis_url: str, concurrency: int, total: int) -> None:
+    client = aioredis.from_url(redis_url, decode_responses=True, max_connections=concurrency)
+    try:
+        pipe = client.pipeline(transaction=False)
+        for i in range(100):
+            pipe.hset(f"bench:batching:item:{i}", mapping={"id": str(i), "sku": f"SKU-{i:03d}"})
+        await pipe.execute()
+
+        print(f"concurrency={concurrency}  requests={total}")
+        for mode in ("unbatched", "pipelined", "auto"):
+            await run_mode(client, mode, concurrency, total)
+    finally:
+        keys = [key async for key in client.scan_iter(match="bench:batching:*", count=1000)]
+        if keys:
+            await client.unlink(*keys)
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--redis", default="redis://localhost:6379")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.redis, args.concurrency, args.requests))
+
+
+if __name__ == "__main__":
+    main()
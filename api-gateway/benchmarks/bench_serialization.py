@@ -0,0 +1,149 @@
+"""
+Per-endpoint response serialization benchmark: stdlib JSON vs orjson
+
+Runs in-process (no gateway needed). For a representative payload of each
+endpoint it times what FastAPI's default pipeline did before - the
+handler's manual str()/float()/isoformat() conversions, jsonable_encoder
+and json.dumps in JSONResponse - against the gateway's FastJSONResponse
+rendering the native values (UUID, Decimal, datetime) with orjson.
+
+Usage:
+    python benchmarks/bench_serialization.py --iterations 2000
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from serialization import FastJSONResponse, dumps  # noqa: E402
+
+
+def native_rows(count: int) -> List[Dict[str, Any]]:
+    """Rows as asyncpg returns them: UUID ids and NUMERIC prices"""
+    return [
+        {
+            "id": uuid.uuid4(),
+            "sku": f"SKU-{i:06d}",
+            "name": f"Product {i}",
+            "stock_level": i % 500,
+            "price": Decimal("1299.99") + i
+        }
+        for i in range(count)
+    ]
+
+
+def to_product(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {**row, "discounted_price": row["price"] * Decimal("0.9")}
+
+
+def to_legacy_product(row: Dict[str, Any]) -> Dict[str, Any]:
+    """What handlers did by hand before: str() ids and float() prices"""
+    return {
+        "id": str(row["id"]),
+        "sku": row["sku"],
+        "name": row["name"],
+        "stock_level": row["stock_level"],
+        "price": float(row["price"]),
+        "discounted_price": float(row["price"]) * 0.9
+    }
+
+
+def page(rows: List[Dict[str, Any]], convert: Callable, legacy: bool) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "products": [convert(row) for row in rows],
+        "next_cursor": "eyJza3UiOiJTS1UtMDAwMDEwIn0",
+        "stale": False,
+        "timestamp": now.isoformat() if legacy else now
+    }
+
+
+def order(legacy: bool) -> Dict[str, Any]:
+    transaction_id, product_id = uuid.uuid4(), uuid.uuid4()
+    expires_at = datetime.now(timezone.utc)
+    now = datetime.utcnow()
+    return {
+        "order_id": "ORD-1760758027-1a2b3c4d",
+        "product_id": "LAPTOP-001",
+        "quantity": 1,
+        "status": "confirmed",
+        "steps": [
+            {"step": name, "status": "completed", "started_at_ms": 0.1, "duration_ms": 50.2}
+            for name in ("inventory_check", "price_calculation", "stock_reservation",
+                         "payment_processing", "order_confirmation")
+        ],
+        "reservation": {
+            "transaction_id": str(transaction_id) if legacy else transaction_id,
+            "product_id": str(product_id) if legacy else product_id,
+            "quantity": 1,
+            "version": 7,
+            "expires_at": expires_at.isoformat() if legacy else expires_at,
+            "attempts": 1
+        },
+        "timestamp": now.isoformat() if legacy else now
+    }
+
+
+def per_call_us(fn: Callable[[], Any], iterations: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows_10, rows_100, rows_500 = native_rows(10), native_rows(100), native_rows(500)
+
+    # endpoint -> (legacy builder + encoder, new builder + encoder)
+    cases = {
+        "GET /health": (
+            lambda: JSONResponse(jsonable_encoder({"status": "healthy", "timestamp": datetime.utcnow().isoformat()})),
+            lambda: FastJSONResponse({"status": "healthy", "timestamp": datetime.utcnow()})
+        ),
+        "GET /products (10)": (
+            lambda: JSONResponse(jsonable_encoder(page(rows_10, to_legacy_product, True))),
+            lambda: dumps(page(rows_10, to_product, False))
+        ),
+        "GET /products (100)": (
+            lambda: JSONResponse(jsonable_encoder(page(rows_100, to_legacy_product, True))),
+            lambda: dumps(page(rows_100, to_product, False))
+        ),
+        "GET /products/batch (100)": (
+            lambda: JSONResponse(jsonable_encoder(page(rows_100, to_legacy_product, True))),
+            lambda: FastJSONResponse(page(rows_100, to_product, False))
+        ),
+        "GET /products/export (500 rows)": (
+            lambda: "".join(json.dumps(to_legacy_product(row)) + "\n" for row in rows_500).encode(),
+            lambda: b"".join(dumps(to_product(row)) + b"\n" for row in rows_500)
+        ),
+        "POST /order": (
+            lambda: JSONResponse(jsonable_encoder(order(True))),
+            lambda: FastJSONResponse(order(False))
+        ),
+    }
+
+    print(f"{'endpoint':<34}{'stdlib':>12}{'orjson':>12}{'speedup':>10}")
+    for name, (legacy, fast) in cases.items():
+        before = per_call_us(legacy, args.iterations)
+        after = per_call_us(fast, args.iterations)
+        print(f"{name:<34}{before:>9.1f} us{after:>9.1f} us{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
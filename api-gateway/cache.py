@@ -0,0 +1,356 @@
+"""
+Caching primitives for the API Gateway
+In-process tiers that sit in front of Redis for hot read paths, and
+command batching for the Redis round-trips behind them
+"""
+
+import math
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from redis.client import NEVER_DECODE
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with per-entry TTL (L1 tier in front of Redis)
+
+    Capped both by entry count and by approximate payload bytes; the least
+    recently used entries are evicted first when either cap is exceeded.
+    Not thread-safe - intended to be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 5.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        # key -> (value, size_bytes, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, _, expires_at = entry
+        if expires_at <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[float] = None) -> None:
+        """Store a value; size is the approximate payload size in bytes"""
+        if size > self.max_bytes:
+            # Never let a single oversized payload flush the whole tier
+            self.delete(key)
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        """Remove a key; returns True if it was present"""
+        if key in self._entries:
+            self._remove(key)
+            return True
+        return False
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of size and hit/miss/eviction counters"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class SingleFlight:
+    """Coalesce concurrent loads for the same key into one in-flight call
+
+    The first caller for a key starts the load; callers arriving while it is
+    still running await the same result (or exception) instead of issuing
+    their own. A caller being cancelled does not cancel the shared load.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Task[Any]"] = {}
+        self.loads = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for key, or join the call already in flight for it"""
+        task = self._calls.get(key)
+        if task is None:
+            self.loads += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def running(self, key: str) -> bool:
+        """True if a load for key is currently in flight"""
+        return key in self._calls
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of load/coalesce counters"""
+        return {
+            "in_flight": len(self._calls),
+            "loads": self.loads,
+            "coalesced": self.coalesced
+        }
+
+    def _finish(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+def should_refresh(
+    soft_expires_at: float,
+    delta: float,
+    beta: float = 1.0,
+    now: Optional[float] = None
+) -> bool:
+    """Probabilistic early expiration (XFetch)
+
+    Returns True once the entry is past its soft expiry, and before that with
+    a probability that grows as the expiry approaches. delta is how long the
+    value took to compute; slower loads start refreshing earlier. beta > 1
+    favours earlier refreshes, beta < 1 later ones.
+    """
+    if now is None:
+        now = time.time()
+    # 1 - random() is in (0, 1], so the log is always defined
+    return now - delta * beta * math.log(1.0 - random.random()) >= soft_expires_at
+
+
+class BackgroundRefresher:
+    """Run cache refreshes off the request path, at most one per key
+
+    Refreshes go through a SingleFlight so a request that misses the cache
+    while a refresh is running joins it instead of querying again.
+    """
+
+    def __init__(self, flight: SingleFlight):
+        self.flight = flight
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+        self.scheduled = 0
+        self.failed = 0
+
+    def schedule(self, key: str, fn: Callable[[], Awaitable[Any]]) -> bool:
+        """Start a background refresh for key unless one is already running"""
+        if self.flight.running(key):
+            return False
+
+        self.scheduled += 1
+        task = asyncio.create_task(self._run(key, fn))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def close(self) -> None:
+        """Cancel outstanding refreshes (used on shutdown)"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of refresh counters"""
+        return {
+            "pending": len(self._tasks),
+            "scheduled": self.scheduled,
+            "failed": self.failed
+        }
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            await self.flight.do(key, fn)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Background refresh of {key} failed: {e}")
+
+
+class RawCommand(tuple):
+    """A Redis command whose reply is returned as bytes, never decoded"""
+
+
+def raw(*command: Any) -> RawCommand:
+    """Mark a command for RedisBatcher as returning raw bytes"""
+    return RawCommand(command)
+
+
+class RedisBatcher:
+    """Send related Redis commands in one pipelined round-trip
+
+    execute() takes commands as tuples, e.g. ("SETEX", key, 60, value), and
+    returns their replies in order (wrap a command in raw() to get its reply
+    as undecoded bytes). With auto_batch enabled, commands from
+    concurrent callers issued within `window` seconds of each other are
+    merged into one pipeline too; each caller still gets only its own
+    replies (or the first error among them).
+    """
+
+    def __init__(
+        self,
+        redis_client: Any,
+        auto_batch: bool = False,
+        window: float = 0.0005,
+        max_batch: int = 256
+    ):
+        self.redis = redis_client
+        self.auto_batch = auto_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Sequence[Tuple[Any, ...]], "asyncio.Future[List[Any]]"]] = []
+        self._pending_commands = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self.calls = 0
+        self.commands = 0
+        self.round_trips = 0
+        self.largest_batch = 0
+
+    async def execute(self, *commands: Tuple[Any, ...]) -> List[Any]:
+        """Run commands in one round-trip (shared with others when auto-batching)"""
+        if not commands:
+            return []
+        self.calls += 1
+        if not self.auto_batch:
+            return self._unpack(await self._send(commands), 0, len(commands))
+
+        future: "asyncio.Future[List[Any]]" = asyncio.get_running_loop().create_future()
+        self._pending.append((commands, future))
+        self._pending_commands += len(commands)
+        if self._pending_commands >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    async def close(self) -> None:
+        """Send anything still queued and wait for in-flight batches"""
+        if self._pending:
+            self._flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of batching counters"""
+        return {
+            "auto_batch": self.auto_batch,
+            "calls": self.calls,
+            "commands": self.commands,
+            "round_trips": self.round_trips,
+            "round_trips_per_call": round(self.round_trips / self.calls, 4) if self.calls else 0.0,
+            "commands_per_round_trip": round(self.commands / self.round_trips, 2) if self.round_trips else 0.0,
+            "largest_batch": self.largest_batch
+        }
+
+    async def _send(self, commands: Sequence[Tuple[Any, ...]]) -> List[Any]:
+        self.commands += len(commands)
+        self.round_trips += 1
+        self.largest_batch = max(self.largest_batch, len(commands))
+        pipe = self.redis.pipeline(transaction=False)
+        for command in commands:
+            if isinstance(command, RawCommand):
+                pipe.execute_command(*command, **{NEVER_DECODE: []})
+            else:
+                pipe.execute_command(*command)
+        # Errors come back in place so one bad command only fails its caller
+        return await pipe.execute(raise_on_error=False)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_commands = self._pending, [], 0
+        task = asyncio.create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(
+        self,
+        batch: List[Tuple[Sequence[Tuple[Any, ...]], "asyncio.Future[List[Any]]"]]
+    ) -> None:
+        try:
+            replies = await self._send([command for commands, _ in batch for command in commands])
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for commands, future in batch:
+            if not future.done():
+                try:
+                    future.set_result(self._unpack(replies, offset, len(commands)))
+                except Exception as e:
+                    future.set_exception(e)
+            offset += len(commands)
+
+    @staticmethod
+    def _unpack(replies: List[Any], offset: int, count: int) -> List[Any]:
+        own = replies[offset:offset + count]
+        for reply in own:
+            if isinstance(reply, Exception):
+                raise reply
+        return own
@@ -0,0 +1,145 @@
+"""
+Binary codecs for values cached in Redis
+Every payload starts with a small header so formats can be rolled forward
+"""
+
+import json
+import zlib
+import struct
+import logging
+from typing import Any, Callable, Dict, List, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+# Header: envelope version, serializer id, compression id
+HEADER = struct.Struct("!BBB")
+ENVELOPE_VERSION = 1
+
+SERIALIZER_IDS = {"json": 1, "orjson": 2, "msgpack": 3}
+COMPRESSION_IDS = {"none": 0, "zlib": 1, "lz4": 2}
+
+
+class CodecError(ValueError):
+    """Raised when a cached payload cannot be decoded"""
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _serializers() -> Dict[int, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    """Serializers available in this process, keyed by wire id"""
+    available = {SERIALIZER_IDS["json"]: (_json_dumps, json.loads)}
+    if orjson is not None:
+        available[SERIALIZER_IDS["orjson"]] = (orjson.dumps, orjson.loads)
+    if msgpack is not None:
+        available[SERIALIZER_IDS["msgpack"]] = (
+            msgpack.packb,
+            lambda data: msgpack.unpackb(data, raw=False)
+        )
+    return available
+
+
+def _compressors() -> Dict[int, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+    """Compressors available in this process, keyed by wire id"""
+    available = {
+        COMPRESSION_IDS["none"]: (lambda data: data, lambda data: data),
+        COMPRESSION_IDS["zlib"]: (lambda data: zlib.compress(data, 1), zlib.decompress)
+    }
+    if lz4_frame is not None:
+        available[COMPRESSION_IDS["lz4"]] = (lz4_frame.compress, lz4_frame.decompress)
+    return available
+
+
+def available_formats() -> Tuple[List[str], List[str]]:
+    """Names of the serializers and compressions usable in this process"""
+    serializers, compressors = _serializers(), _compressors()
+    return (
+        [name for name, wire_id in SERIALIZER_IDS.items() if wire_id in serializers],
+        [name for name, wire_id in COMPRESSION_IDS.items() if wire_id in compressors]
+    )
+
+
+class CacheCodec:
+    """Encode values for Redis with a configurable serializer and compression
+
+    Payloads smaller than compress_min_bytes are stored uncompressed. The
+    header records which serializer and compression wrote a payload, so a
+    reader decodes anything written by any format it knows, whatever it is
+    configured to write - formats can be switched without flushing Redis.
+    """
+
+    def __init__(
+        self,
+        serializer: str = "orjson",
+        compression: str = "none",
+        compress_min_bytes: int = 1024
+    ):
+        self._serializers = _serializers()
+        self._compressors = _compressors()
+
+        if SERIALIZER_IDS.get(serializer) not in self._serializers:
+            logger.warning(f"Cache serializer {serializer!r} not available, using json")
+            serializer = "json"
+        if COMPRESSION_IDS.get(compression) not in self._compressors:
+            logger.warning(f"Cache compression {compression!r} not available, storing uncompressed")
+            compression = "none"
+
+        self.serializer = serializer
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self._serializer_id = SERIALIZER_IDS[serializer]
+        self._compression_id = COMPRESSION_IDS[compression]
+        self._dumps = self._serializers[self._serializer_id][0]
+        self._compress = self._compressors[self._compression_id][0]
+
+    def encode(self, value: Any) -> bytes:
+        """Serialize (and compress if large enough) behind a format header"""
+        payload = self._dumps(value)
+        compression_id = COMPRESSION_IDS["none"]
+        if self._compression_id and len(payload) >= self.compress_min_bytes:
+            payload = self._compress(payload)
+            compression_id = self._compression_id
+        return HEADER.pack(ENVELOPE_VERSION, self._serializer_id, compression_id) + payload
+
+    def decode(self, data: bytes) -> Any:
+        """Decode a payload written by any known serializer/compression"""
+        if len(data) < HEADER.size:
+            raise CodecError("Cached payload too short")
+
+        version, serializer_id, compression_id = HEADER.unpack_from(data)
+        if version != ENVELOPE_VERSION:
+            raise CodecError(f"Unknown cache envelope version {version}")
+        serializer = self._serializers.get(serializer_id)
+        compressor = self._compressors.get(compression_id)
+        if serializer is None or compressor is None:
+            raise CodecError(f"Unsupported cache format {serializer_id}/{compression_id}")
+
+        try:
+            return serializer[1](compressor[1](data[HEADER.size:]))
+        except Exception as e:
+            raise CodecError(f"Corrupt cached payload: {e}") from e
+
+    def describe(self) -> Dict[str, Any]:
+        """Active write format, for /metrics"""
+        return {
+            "serializer": self.serializer,
+            "compression": self.compression,
+            "compress_min_bytes": self.compress_min_bytes
+        }
+
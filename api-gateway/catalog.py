@@ -0,0 +1,655 @@
+"""
+Product catalog reads for the API Gateway
+Per-product Redis entries plus an SKU-ordered index, backed by PostgreSQL
+"""
+
+import json
+import time
+import uuid
+import bisect
+import asyncio
+import logging
+from decimal import Decimal
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from cache import SingleFlight, BackgroundRefresher, RedisBatcher, raw, should_refresh
+from cache_codec import CacheCodec, CodecError
+from database import queries
+
+logger = logging.getLogger(__name__)
+
+# Redis layout:
+#   products:item:<id>     STRING one product, encoded by the cache codec as
+#                                [id, sku, name, stock_level, price]
+#   products:index         ZSET  every product as "<sku>\0<id>", all score 0, so
+#                                ZRANGEBYLEX walks the catalog in SKU order
+#   products:skus          HASH  sku -> id, for lookups by SKU
+#   products:index:meta    HASH  soft_expires_at / delta for the index
+#   products:version       STRING counter bumped on every invalidation
+#   products:body:<page>   HASH  encoded response body, etag and the version
+#                                it was built at; ignored once version moves on
+ITEM_KEY_PREFIX = "products:item:"
+INDEX_KEY = "products:index"
+SKU_KEY = "products:skus"
+INDEX_META_KEY = "products:index:meta"
+VERSION_KEY = "products:version"
+BODY_KEY_PREFIX = "products:body:"
+INDEX_SEPARATOR = "\x00"
+
+# Channel the inventory triggers in scripts/init-db.sql pg_notify() on; the
+# name is fixed there, so it is not configurable here either
+CHANGE_CHANNEL = "inventory_changes"
+
+PRODUCT_COLUMNS = "id, sku, name, stock_level, price"
+
+DISCOUNT_RATE = Decimal("0.9")
+ZERO = Decimal(0)
+
+# Products by id and/or SKU (cache misses of get_many)
+LOAD_PRODUCTS = queries.register(
+    "catalog.load_products",
+    f"SELECT {PRODUCT_COLUMNS} "
+    "FROM inventory.products "
+    "WHERE id = ANY($1::uuid[]) OR sku = ANY($2::text[])"
+)
+# SKU order everywhere a cursor is involved is byte order (COLLATE "C"), the
+# order ZRANGEBYLEX and bisect use. The database's default collation (e.g.
+# en_US.UTF-8) sorts differently, and a cursor issued by one path would then
+# skip or repeat rows on another.
+SKU_ORDER = 'sku COLLATE "C"'
+
+# Every (id, sku) pair, in SKU order, for the Redis index
+INDEX_ENTRIES = queries.register(
+    "catalog.index_entries",
+    f"SELECT id, sku FROM inventory.products ORDER BY {SKU_ORDER}"
+)
+# Keyset pages over idx_products_sku_c when Redis is unavailable
+FIRST_PAGE = queries.register(
+    "catalog.first_page",
+    f"SELECT {PRODUCT_COLUMNS} "
+    "FROM inventory.products "
+    f"ORDER BY {SKU_ORDER} "
+    "LIMIT $1"
+)
+NEXT_PAGE = queries.register(
+    "catalog.next_page",
+    f"SELECT {PRODUCT_COLUMNS} "
+    "FROM inventory.products "
+    f"WHERE {SKU_ORDER} > $2 "
+    f"ORDER BY {SKU_ORDER} "
+    "LIMIT $1"
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    """One catalog product, built straight from an inventory.products row
+
+    Slotted and immutable so pages of thousands stay cheap to hold. The id
+    is kept in its canonical string form (as cached entries carry it) and
+    the price as an exact Decimal; the response models validate and
+    serialize straight from these attributes.
+    """
+
+    id: str
+    sku: str
+    name: str
+    stock_level: int
+    price: Decimal
+
+    @property
+    def discounted_price(self) -> Decimal:
+        # Mock pricing calculation
+        return self.price * DISCOUNT_RATE
+
+    @classmethod
+    def from_record(cls, row: asyncpg.Record) -> "Product":
+        """Map a row selected with PRODUCT_COLUMNS"""
+        return cls(str(row["id"]), row["sku"], row["name"], row["stock_level"], row["price"] or ZERO)
+
+
+def item_key(product_id: str) -> str:
+    """Redis key of the entry holding one product"""
+    return f"{ITEM_KEY_PREFIX}{product_id}"
+
+
+def product_to_entry(product: Product) -> List[Any]:
+    """Compact positional form of a product for the cache codec
+
+    The price is kept as its exact decimal string.
+    """
+    return [product.id, product.sku, product.name, product.stock_level, str(product.price)]
+
+
+def product_from_entry(entry: List[Any]) -> Product:
+    """Rebuild a product from a cached entry"""
+    product_id, sku, name, stock_level, price = entry
+    return Product(product_id, sku, name, stock_level, Decimal(str(price)))
+
+
+class ProductCatalog:
+    """Read path for products: Redis per-product entries in front of PostgreSQL
+
+    Each product is cached once, however many pages or batches it appears
+    in, so a stock or price change only has to evict that product's entry.
+    List pages are assembled from the SKU index plus the per-item STRING
+    entries; only items missing from Redis are loaded from PostgreSQL. The
+    index itself is stale-while-revalidate: past its soft expiry it is
+    still used while a background task rebuilds it.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[asyncpg.Pool],
+        redis_client: Optional[aioredis.Redis],
+        ttl: int = 300,
+        soft_ttl: int = 240,
+        xfetch_beta: float = 1.0,
+        batcher: Optional[RedisBatcher] = None,
+        codec: Optional[CacheCodec] = None,
+        body_ttl: int = 60
+    ):
+        self.pool = pool
+        self.redis = redis_client
+        self.codec = codec or CacheCodec()
+        self.body_ttl = body_ttl
+        # Reads and write-backs go through the batcher so concurrent
+        # requests can share round-trips; index swaps keep their own MULTI
+        self.commands = batcher or RedisBatcher(redis_client)
+        self.ttl = ttl
+        self.soft_ttl = soft_ttl
+        self.xfetch_beta = xfetch_beta
+        self.index_loads = SingleFlight()
+        self.index_refresher = BackgroundRefresher(self.index_loads)
+        self.item_hits = 0
+        self.item_misses = 0
+        self.index_rebuilds = 0
+        self.invalidations = 0
+        self.decode_errors = 0
+        self.body_hits = 0
+        self.body_misses = 0
+
+    async def page(self, limit: int, after_sku: Optional[str] = None) -> Dict[str, Any]:
+        """Return one SKU-ordered page
+
+        The result has products, next_after (the SKU to continue after, or
+        None on the last page) and stale (the index was past its soft
+        expiry).
+        """
+        if not self.redis:
+            return await self._page_from_database(limit, after_sku)
+
+        # "<sku>\x01" sorts after every "<sku>\0<id>" member and before any longer SKU
+        start = f"[{after_sku}\x01" if after_sku is not None else "-"
+        try:
+            meta, members = await self.commands.execute(
+                ("HGETALL", INDEX_META_KEY),
+                ("ZRANGEBYLEX", INDEX_KEY, start, "+", "LIMIT", 0, limit + 1)
+            )
+        except RedisError as e:
+            logger.warning(f"Cache read failed: {e}")
+            return await self._page_from_database(limit, after_sku)
+
+        stale = False
+        if not meta:
+            # Cold index: build it (once, however many callers are waiting)
+            # and slice the page out of the freshly loaded entries
+            entries = await self.index_loads.do(INDEX_KEY, self._rebuild_index)
+            members = self._slice(entries, after_sku, limit + 1)
+        elif should_refresh(float(meta["soft_expires_at"]), float(meta["delta"]), self.xfetch_beta):
+            stale = time.time() >= float(meta["soft_expires_at"])
+            self.index_refresher.schedule(INDEX_KEY, self._rebuild_index)
+
+        has_more = len(members) > limit
+        skus_and_ids = [member.split(INDEX_SEPARATOR, 1) for member in members[:limit]]
+        products, _ = await self._get_by_ids([product_id for _, product_id in skus_and_ids])
+
+        page_products = [products[product_id] for _, product_id in skus_and_ids if product_id in products]
+        return {
+            "products": page_products,
+            "next_after": skus_and_ids[-1][0] if has_more else None,
+            "stale": stale
+        }
+
+    async def get_many(self, refs: List[str]) -> Tuple[Dict[str, Product], int]:
+        """Resolve product ids and/or SKUs; returns (ref -> product, cache hits)"""
+        product_ids: Dict[str, str] = {}
+        skus: List[str] = []
+        for ref in refs:
+            try:
+                product_ids[ref] = str(uuid.UUID(ref))
+            except ValueError:
+                skus.append(ref)
+
+        # SKUs are resolved to ids through the SKU hash when it is warm
+        resolved_skus: List[str] = []
+        if skus and self.redis:
+            try:
+                resolved, = await self.commands.execute(("HMGET", SKU_KEY, *skus))
+                for sku, product_id in zip(skus, resolved):
+                    if product_id:
+                        product_ids[sku] = product_id
+                        resolved_skus.append(sku)
+            except RedisError as e:
+                logger.warning(f"Cache read failed: {e}")
+
+        products, cache_hits = await self._get_by_ids(
+            list(dict.fromkeys(product_ids.values())),
+            skus=[sku for sku in skus if sku not in product_ids]
+        )
+
+        # A hash entry can predate a SKU rename; such SKUs are looked up again
+        renamed = [
+            sku for sku in resolved_skus
+            if product_ids[sku] in products and products[product_ids[sku]].sku != sku
+        ]
+        for sku in renamed:
+            del product_ids[sku]
+        if renamed:
+            products.update(await self._load_items([], renamed))
+
+        found: Dict[str, Product] = {}
+        by_sku = {product.sku: product for product in products.values()}
+        for ref in refs:
+            product = products.get(product_ids[ref]) if ref in product_ids else by_sku.get(ref)
+            if product is not None:
+                found[ref] = product
+        return found, cache_hits
+
+    async def get_body(self, page_key: str) -> Tuple[Optional[bytes], Optional[str], int]:
+        """Return (body, etag, version) for a cached response body
+
+        body and etag are None on a miss. version is the current catalog
+        version; pass it back to set_body() so a body assembled while an
+        invalidation happened is never served as current.
+        """
+        if not self.redis:
+            return None, None, 0
+        try:
+            version, (body_version, etag, body) = await self.commands.execute(
+                ("GET", VERSION_KEY),
+                raw("HMGET", f"{BODY_KEY_PREFIX}{page_key}", "version", "etag", "body")
+            )
+        except RedisError as e:
+            logger.warning(f"Cache read failed: {e}")
+            return None, None, 0
+
+        version = int(version or 0)
+        if body is None or body_version is None or int(body_version) != version:
+            self.body_misses += 1
+            return None, None, version
+        self.body_hits += 1
+        return body, etag.decode(), version
+
+    async def get_etag(self, page_key: str) -> Tuple[Optional[str], int]:
+        """Return (etag, version) without fetching the body
+
+        etag is None unless a body is cached for page_key at the current
+        catalog version, so a match means the client's copy is up to date.
+        """
+        if not self.redis:
+            return None, 0
+        try:
+            version, (body_version, etag) = await self.commands.execute(
+                ("GET", VERSION_KEY),
+                ("HMGET", f"{BODY_KEY_PREFIX}{page_key}", "version", "etag")
+            )
+        except RedisError as e:
+            logger.warning(f"Cache read failed: {e}")
+            return None, 0
+
+        version = int(version or 0)
+        if etag is None or body_version is None or int(body_version) != version:
+            return None, version
+        return etag, version
+
+    async def set_body(self, page_key: str, body: bytes, etag: str, version: int) -> None:
+        """Cache an encoded response body built at the given catalog version"""
+        if not self.redis:
+            return
+        key = f"{BODY_KEY_PREFIX}{page_key}"
+        try:
+            await self.commands.execute(
+                ("HSET", key, "version", version, "etag", etag, "body", body),
+                ("EXPIRE", key, self.body_ttl)
+            )
+        except RedisError as e:
+            logger.warning(f"Cache write failed: {e}")
+
+    async def invalidate(self, product_ids: Iterable[str]) -> None:
+        """Evict the given products; the next read reloads just those rows"""
+        keys = [item_key(product_id) for product_id in product_ids]
+        if keys and self.redis:
+            self.invalidations += len(keys)
+            await self.commands.execute(("DEL", *keys), ("INCR", VERSION_KEY))
+
+    async def invalidate_index(self) -> None:
+        """Force an index rebuild (products added/removed or SKUs changed)"""
+        if self.redis:
+            await self.commands.execute(("DEL", INDEX_META_KEY, SKU_KEY), ("INCR", VERSION_KEY))
+
+    async def invalidate_all(self) -> None:
+        """Evict every cached product and the index (e.g. after missed changes)"""
+        if not self.redis:
+            return
+        keys = [INDEX_META_KEY, SKU_KEY]
+        async for key in self.redis.scan_iter(match=f"{ITEM_KEY_PREFIX}*", count=500):
+            keys.append(key)
+            if len(keys) >= 500:
+                self.invalidations += len(keys)
+                await self.redis.unlink(*keys)
+                keys = []
+        if keys:
+            self.invalidations += len(keys)
+            await self.redis.unlink(*keys)
+        await self.redis.incr(VERSION_KEY)
+
+    async def close(self) -> None:
+        """Cancel background index refreshes"""
+        await self.index_refresher.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of item/index counters"""
+        lookups = self.item_hits + self.item_misses
+        return {
+            "item_hits": self.item_hits,
+            "item_misses": self.item_misses,
+            "item_hit_ratio": round(self.item_hits / lookups, 4) if lookups else 0.0,
+            "index_rebuilds": self.index_rebuilds,
+            "index_loads": self.index_loads.stats(),
+            "index_refreshes": self.index_refresher.stats(),
+            "invalidations": self.invalidations,
+            "decode_errors": self.decode_errors,
+            "body_hits": self.body_hits,
+            "body_misses": self.body_misses,
+            "codec": self.codec.describe()
+        }
+
+    async def _get_by_ids(
+        self,
+        product_ids: List[str],
+        skus: Optional[List[str]] = None
+    ) -> Tuple[Dict[str, Product], int]:
+        """Read items through Redis; load misses (and uncached SKUs) in one query"""
+        products: Dict[str, Product] = {}
+        if self.redis and product_ids:
+            try:
+                replies = await self.commands.execute(
+                    *[raw("GET", item_key(product_id)) for product_id in product_ids]
+                )
+                for product_id, data in zip(product_ids, replies):
+                    if data is None:
+                        continue
+                    try:
+                        products[product_id] = product_from_entry(self.codec.decode(data))
+                    except (CodecError, ValueError, TypeError) as e:
+                        # Unreadable entries are treated as misses and overwritten
+                        self.decode_errors += 1
+                        logger.warning(f"Discarding cached product {product_id}: {e}")
+            except RedisError as e:
+                logger.warning(f"Cache read failed: {e}")
+        cache_hits = len(products)
+        self.item_hits += cache_hits
+
+        missing = [product_id for product_id in product_ids if product_id not in products]
+        self.item_misses += len(missing) + len(skus or [])
+        if missing or skus:
+            loaded = await self._load_items(missing, skus or [])
+            products.update(loaded)
+        return products, cache_hits
+
+    async def _load_items(self, product_ids: List[str], skus: List[str]) -> Dict[str, Product]:
+        """Fetch products by id/SKU from PostgreSQL and write them back to Redis"""
+        if not self.pool:
+            raise RuntimeError("Database connection not available")
+
+        async with self.pool.acquire() as conn:
+            rows = await LOAD_PRODUCTS.fetch(
+                conn,
+                [uuid.UUID(product_id) for product_id in product_ids],
+                skus
+            )
+
+        loaded = {str(row["id"]): Product.from_record(row) for row in rows}
+        if self.redis and loaded:
+            try:
+                await self.commands.execute(*[
+                    ("SET", item_key(product_id), self.codec.encode(product_to_entry(product)), "EX", self.ttl)
+                    for product_id, product in loaded.items()
+                ])
+            except RedisError as e:
+                logger.warning(f"Cache write failed: {e}")
+        return loaded
+
+    async def _rebuild_index(self) -> List[str]:
+        """Reload the SKU index from PostgreSQL and swap it in atomically"""
+        if not self.pool:
+            raise RuntimeError("Database connection not available")
+
+        started = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            rows = await INDEX_ENTRIES.fetch(conn)
+        # Already in byte order; sorting again keeps bisect in _slice correct
+        # even if the query's ordering ever drifts from Redis's
+        entries = sorted(f"{row['sku']}{INDEX_SEPARATOR}{row['id']}" for row in rows)
+        self.index_rebuilds += 1
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(INDEX_KEY, SKU_KEY)
+        if entries:
+            pipe.zadd(INDEX_KEY, {entry: 0 for entry in entries})
+            pipe.hset(SKU_KEY, mapping={row["sku"]: str(row["id"]) for row in rows})
+            pipe.expire(INDEX_KEY, self.ttl)
+            pipe.expire(SKU_KEY, self.ttl)
+        pipe.hset(INDEX_META_KEY, mapping={
+            "soft_expires_at": time.time() + self.soft_ttl,
+            "delta": time.perf_counter() - started
+        })
+        pipe.expire(INDEX_META_KEY, self.ttl)
+        await pipe.execute()
+        return entries
+
+    @staticmethod
+    def _slice(entries: List[str], after_sku: Optional[str], count: int) -> List[str]:
+        """Same range as the ZRANGEBYLEX in page(), over an in-memory index"""
+        start = 0
+        if after_sku is not None:
+            start = bisect.bisect_left(entries, f"{after_sku}\x01")
+        return entries[start:start + count]
+
+    async def _page_from_database(self, limit: int, after_sku: Optional[str]) -> Dict[str, Any]:
+        """Keyset page straight from PostgreSQL (used when Redis is down)
+
+        Pages are keyed on sku in byte order (idx_products_sku_c), so every
+        page is an index range scan no matter how deep it is. One extra row is fetched to tell
+        whether a next page exists.
+        """
+        if not self.pool:
+            raise RuntimeError("Database connection not available")
+
+        async with self.pool.acquire() as conn:
+            if after_sku is None:
+                rows = await FIRST_PAGE.fetch(conn, limit + 1)
+            else:
+                rows = await NEXT_PAGE.fetch(conn, limit + 1, after_sku)
+
+        return {
+            "products": [Product.from_record(row) for row in rows[:limit]],
+            "next_after": rows[limit - 1]["sku"] if len(rows) > limit else None,
+            "stale": False
+        }
+
+
+class CatalogChangeListener:
+    """Evict catalog cache entries as PostgreSQL announces product changes
+
+    Holds one dedicated connection (outside the pool) LISTENing on the
+    channel fed by the inventory triggers in scripts/init-db.sql. Bursts of
+    notifications are drained together so one Redis call evicts them all.
+    If the connection drops it reconnects with backoff and, since changes
+    may have been missed meanwhile, invalidates the whole catalog.
+
+    before_invalidate runs ahead of each eviction (e.g. to stop refills
+    from lagging replicas before anything can miss), on_invalidate after it.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        catalog: ProductCatalog,
+        channel: str = CHANGE_CHANNEL,
+        before_invalidate: Optional[Callable[[], None]] = None,
+        on_invalidate: Optional[Callable[[], None]] = None,
+        health_check_interval: float = 15.0
+    ):
+        self.dsn = dsn
+        self.catalog = catalog
+        self.channel = channel
+        self.before_invalidate = before_invalidate
+        self.on_invalidate = on_invalidate
+        self.health_check_interval = health_check_interval
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks: List["asyncio.Task[None]"] = []
+        self.connected = False
+        self.notifications = 0
+        self.evicted_products = 0
+        self.index_invalidations = 0
+        self.reconnects = 0
+        self.errors = 0
+        self.malformed = 0
+        self.last_lag_ms: Optional[float] = None
+        self.max_lag_ms = 0.0
+        self._lag_total_ms = 0.0
+
+    def start(self) -> None:
+        """Start the listen and apply loops on the running event loop"""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._listen_loop()),
+                asyncio.create_task(self._apply_loop())
+            ]
+
+    async def stop(self) -> None:
+        """Cancel both loops and close the listener connection"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of connection state, throughput and notification lag"""
+        return {
+            "connected": self.connected,
+            "channel": self.channel,
+            "notifications": self.notifications,
+            "evicted_products": self.evicted_products,
+            "index_invalidations": self.index_invalidations,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+            "malformed": self.malformed,
+            "queued": self._queue.qsize(),
+            "last_lag_ms": round(self.last_lag_ms, 2) if self.last_lag_ms is not None else None,
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "avg_lag_ms": round(self._lag_total_ms / self.notifications, 2) if self.notifications else 0.0
+        }
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        self._queue.put_nowait(payload)
+
+    async def _listen_loop(self) -> None:
+        backoff = 1.0
+        first_connect = True
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(self.channel, self._on_notification)
+                self.connected = True
+                backoff = 1.0
+                logger.info(f"Listening for catalog changes on {self.channel}")
+
+                if not first_connect:
+                    # Anything that changed while we were away went unannounced
+                    self.reconnects += 1
+                    if self.before_invalidate:
+                        self.before_invalidate()
+                    await self.catalog.invalidate_all()
+                    if self.on_invalidate:
+                        self.on_invalidate()
+                first_connect = False
+
+                # Idle connections can die silently; probe them periodically
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), self.health_check_interval)
+                    except asyncio.TimeoutError:
+                        await conn.fetchval("SELECT 1", timeout=5)
+                raise ConnectionError("listener connection closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Catalog change listener disconnected: {e}")
+            finally:
+                self.connected = False
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    async def _apply_loop(self) -> None:
+        # Nothing restarts this task, and the listener keeps queueing while
+        # it is gone, so no single batch may end it
+        while True:
+            payloads = [await self._queue.get()]
+            while not self._queue.empty():
+                payloads.append(self._queue.get_nowait())
+            try:
+                await self._apply(payloads)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Catalog invalidation failed: {e}")
+
+    async def _apply(self, payloads: List[str]) -> None:
+        product_ids = set()
+        reindex = False
+        now = time.time()
+        for payload in payloads:
+            try:
+                change = json.loads(payload)
+                product_id = str(change["id"])
+                changed_at = float(change["at"])
+                reindex = reindex or bool(change.get("reindex", False))
+            except (ValueError, TypeError, KeyError):
+                # e.g. a hand-written NOTIFY without the trigger's fields
+                self.malformed += 1
+                logger.warning(f"Ignoring malformed change notification: {payload}")
+                continue
+            product_ids.add(product_id)
+            lag_ms = max(0.0, (now - changed_at) * 1000)
+            self.notifications += 1
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            self._lag_total_ms += lag_ms
+
+        if not product_ids and not reindex:
+            return
+        if self.before_invalidate:
+            self.before_invalidate()
+        await self.catalog.invalidate(product_ids)
+        self.evicted_products += len(product_ids)
+        if reindex:
+            await self.catalog.invalidate_index()
+            self.index_invalidations += 1
+        if self.on_invalidate:
+            self.on_invalidate()
@@ -0,0 +1,432 @@
+"""
+PostgreSQL pooling for the API Gateway
+Sizes each worker's asyncpg pool from a deployment-wide connection budget,
+meters how long callers wait to acquire a connection, keeps every
+registered statement prepared on every pooled connection, and routes
+read-only work to replicas that are keeping up
+"""
+
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from metrics import Histogram
+from workers import pool_share
+
+logger = logging.getLogger(__name__)
+
+
+class Query:
+    """One registered SQL statement with its call count and latency
+
+    fetch/fetchrow/fetchval/cursor take the connection to run on, so callers
+    keep managing acquisition and transactions exactly as before. The text
+    is passed through unchanged, so on a pooled connection asyncpg finds
+    the statement its pool prepared at connect time and skips parse and plan.
+    """
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    async def fetch(self, conn: Any, *args: Any, timeout: Optional[float] = None) -> List[asyncpg.Record]:
+        return await self._run(conn.fetch, args, timeout)
+
+    async def fetchrow(self, conn: Any, *args: Any, timeout: Optional[float] = None) -> Optional[asyncpg.Record]:
+        return await self._run(conn.fetchrow, args, timeout)
+
+    async def fetchval(self, conn: Any, *args: Any, timeout: Optional[float] = None) -> Any:
+        return await self._run(conn.fetchval, args, timeout)
+
+    async def cursor(self, conn: Any, *args: Any, prefetch: Optional[int] = None) -> Any:
+        """Open a server-side cursor (must be inside a transaction)"""
+        started = time.perf_counter()
+        try:
+            return await conn.cursor(self.sql, *args, prefetch=prefetch)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._record(started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency": self.latency.stats()
+        }
+
+    async def _run(self, method: Callable[..., Awaitable[Any]], args: Any, timeout: Optional[float]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await method(self.sql, *args, timeout=timeout)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._record(started)
+
+    def _record(self, started: float) -> None:
+        self.calls += 1
+        self.latency.observe((time.perf_counter() - started) * 1000)
+
+
+class QueryRegistry:
+    """Every SQL statement the gateway runs, declared once by name
+
+    Modules register their statements at import time. Pools created with
+    the registry prepare all of them on each new connection (asyncpg's
+    `init` hook) into that connection's statement cache, which asyncpg's
+    query methods consult first and which already re-prepares after a
+    schema change. The cache must hold at least every registered statement
+    (asyncpg's default statement_cache_size is 100).
+    """
+
+    def __init__(self):
+        self.queries: Dict[str, Query] = {}
+        self.prepared_connections = 0
+        self.prepare_failures = 0
+
+    def register(self, name: str, sql: str) -> Query:
+        if name in self.queries:
+            raise ValueError(f"query {name} is already registered")
+        query = Query(name, sql)
+        self.queries[name] = query
+        return query
+
+    async def prepare_all(self, conn: asyncpg.Connection) -> None:
+        """Pool init hook: prepare every registered statement on conn
+
+        A statement that fails to prepare (e.g. its table does not exist
+        yet, or the private asyncpg API below changed) is logged and left
+        to be prepared on first use, so it never stops the pool from opening.
+        """
+        for query in self.queries.values():
+            try:
+                # The same cache lookup conn.fetch() does, minus execution;
+                # Connection.prepare() would bypass the cache. _get_statement
+                # is private: its signature is that of asyncpg==0.29.0, the
+                # version pinned in requirements.txt - recheck on upgrade
+                await conn._get_statement(query.sql, None)
+            except Exception as e:
+                self.prepare_failures += 1
+                logger.warning(f"Could not prepare query {query.name}: {e}")
+        self.prepared_connections += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-statement call counts and latency"""
+        return {
+            "registered": len(self.queries),
+            "prepared_connections": self.prepared_connections,
+            "prepare_failures": self.prepare_failures,
+            "statements": {name: query.stats() for name, query in self.queries.items()}
+        }
+
+
+# Shared registry; modules declare their statements with queries.register()
+queries = QueryRegistry()
+
+
+class ConnectionBudget:
+    """Split a total PostgreSQL connection budget across replicas and workers
+
+    Every gateway pod runs `workers` processes and every process owns its
+    own pool, so each pool gets total // (replicas * workers) connections,
+    less `reserved` per worker for connections held outside the pool (the
+    LISTEN connection).
+    """
+
+    def __init__(self, total: int, replicas: int = 1, workers: int = 1, reserved: int = 0):
+        self.total = total
+        self.replicas = max(1, replicas)
+        self.workers = max(1, workers)
+        self.reserved = reserved
+
+    @property
+    def processes(self) -> int:
+        return self.replicas * self.workers
+
+    @property
+    def pool_size(self) -> int:
+        """max_size for this worker's pool (never below 1)"""
+        return pool_share(self.total, self.processes, self.reserved)
+
+    @property
+    def oversubscribed(self) -> bool:
+        """True when even one connection per pool exceeds the budget"""
+        return (self.pool_size + self.reserved) * self.processes > self.total
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "replicas": self.replicas,
+            "workers_per_replica": self.workers,
+            "reserved_per_worker": self.reserved,
+            "pool_size": self.pool_size,
+            "oversubscribed": self.oversubscribed
+        }
+
+
+class MeteredPool:
+    """asyncpg pool wrapper that bounds and records acquire waits
+
+    acquire() is used exactly like asyncpg's (`async with pool.acquire()
+    as conn`), but applies acquire_timeout by default so callers fail with
+    asyncio.TimeoutError instead of queueing forever on a saturated pool,
+    and records every wait in a histogram. Anything else is delegated.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, acquire_timeout: Optional[float] = None, budget: Optional[ConnectionBudget] = None):
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.budget = budget
+        self.wait = Histogram()
+        self.acquired = 0
+        self.timeouts = 0
+
+    @asynccontextmanager
+    async def acquire(self, *, timeout: Optional[float] = None) -> AsyncIterator[asyncpg.Connection]:
+        started = time.perf_counter()
+        try:
+            conn = await self._pool.acquire(timeout=timeout if timeout is not None else self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.wait.observe((time.perf_counter() - started) * 1000)
+            raise
+        self.wait.observe((time.perf_counter() - started) * 1000)
+        self.acquired += 1
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+
+    async def close(self) -> None:
+        await self._pool.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool occupancy, acquire counters and the wait-time histogram"""
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+            "acquire_timeout_seconds": self.acquire_timeout,
+            "acquired": self.acquired,
+            "acquire_timeouts": self.timeouts,
+            "acquire_wait": self.wait.stats(),
+            "budget": self.budget.stats() if self.budget else None
+        }
+
+
+async def create_pool(
+    dsn: str,
+    budget: ConnectionBudget,
+    registry: Optional[QueryRegistry] = queries,
+    min_size: int = 2,
+    acquire_timeout: Optional[float] = 5.0,
+    max_queries: int = 50000,
+    max_inactive_connection_lifetime: float = 300.0,
+    **kwargs: Any
+) -> MeteredPool:
+    """Open this worker's pool at its share of the budget
+
+    Connections are replaced after max_queries queries and closed after
+    max_inactive_connection_lifetime idle seconds, so a pool that grew
+    during a burst shrinks back towards min_size. Every new connection,
+    replacements included, gets the registry's statements prepared.
+    """
+    if budget.oversubscribed:
+        logger.warning(
+            f"PostgreSQL budget of {budget.total} connections is too small for "
+            f"{budget.processes} worker pools; each still opens at least one"
+        )
+    max_size = budget.pool_size
+    pool = await asyncpg.create_pool(
+        dsn,
+        min_size=min(min_size, max_size),
+        max_size=max_size,
+        max_queries=max_queries,
+        max_inactive_connection_lifetime=max_inactive_connection_lifetime,
+        init=registry.prepare_all if registry else None,
+        **kwargs
+    )
+    return MeteredPool(pool, acquire_timeout=acquire_timeout, budget=budget)
+
+
+# Seconds the replica is behind the primary. 0 on a server that is not a
+# standby, and 0 while a WAL receiver is connected and everything received
+# has been replayed (an idle primary would otherwise look ever more "lagged";
+# right after a restart the receive position can even trail the replay
+# position). Otherwise, time since the last replayed transaction.
+REPLICA_LAG = queries.register(
+    "replica.lag",
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_replay_lsn() >= pg_last_wal_receive_lsn() "
+    "AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END::float8"
+)
+
+
+class Replica:
+    """One read replica's pool and its last measured lag"""
+
+    def __init__(self, name: str, pool: MeteredPool):
+        self.name = name
+        self.pool = pool
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.check_errors = 0
+        self.reads = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag_seconds, 3) if self.lag_seconds is not None else None,
+            "checked_at": self.checked_at,
+            "check_errors": self.check_errors,
+            "reads": self.reads,
+            "pool": self.pool.stats()
+        }
+
+
+class ReplicaRouter:
+    """Read-only pool facade: replicas when they keep up, else the primary
+
+    acquire() has the pool interface, so read paths (the catalog, exports)
+    take a router where they took a pool. Each call goes round-robin to a
+    replica that answered its last lag check within max_lag seconds; with
+    none available it goes to the primary. Writes never come here - they
+    use the primary pool directly.
+
+    pin_primary() sends reads to the primary for a while; it is called
+    before products are evicted from the cache, so the cache is not
+    refilled from a replica that has not replayed the change yet.
+    """
+
+    def __init__(
+        self,
+        primary: MeteredPool,
+        replicas: List[Replica],
+        max_lag: float = 1.0,
+        check_interval: float = 1.0
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = 0
+        self._pinned_until = 0.0
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.primary_reads = 0
+        self.fallbacks = {"lagging": 0, "unavailable": 0, "pinned": 0}
+
+    def start(self) -> None:
+        """Start measuring replica lag on the running event loop"""
+        if self._task is None and self.replicas:
+            self._task = asyncio.create_task(self._monitor_loop())
+
+    async def close(self) -> None:
+        """Stop the lag monitor and close the replica pools"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for replica in self.replicas:
+            await replica.pool.close()
+
+    def pin_primary(self, seconds: Optional[float] = None) -> None:
+        """Route reads to the primary for the next `seconds` (default max_lag)"""
+        until = time.monotonic() + (self.max_lag if seconds is None else seconds)
+        self._pinned_until = max(self._pinned_until, until)
+
+    def reader(self) -> MeteredPool:
+        """The pool the next read should use"""
+        if self.replicas:
+            replica, reason = self._pick()
+            if replica is not None:
+                replica.reads += 1
+                return replica.pool
+            self.fallbacks[reason] += 1
+        self.primary_reads += 1
+        return self.primary
+
+    def acquire(self, *, timeout: Optional[float] = None) -> Any:
+        return self.reader().acquire(timeout=timeout)
+
+    async def check(self) -> None:
+        """Measure every replica's lag once"""
+        for replica in self.replicas:
+            try:
+                async with replica.pool.acquire() as conn:
+                    replica.lag_seconds = await REPLICA_LAG.fetchval(conn, timeout=self.check_interval)
+                replica.healthy = True
+            except Exception as e:
+                if replica.healthy:
+                    logger.warning(f"Replica {replica.name} unavailable, reading from primary: {e}")
+                replica.healthy = False
+                replica.check_errors += 1
+            replica.checked_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        """Where reads went and each replica's state"""
+        return {
+            "max_lag_seconds": self.max_lag,
+            "pinned_to_primary": self._pinned_until > time.monotonic(),
+            "primary_reads": self.primary_reads,
+            "fallbacks": dict(self.fallbacks),
+            "replicas": {replica.name: replica.stats() for replica in self.replicas}
+        }
+
+    def _pick(self) -> Tuple[Optional[Replica], str]:
+        if self._pinned_until > time.monotonic():
+            return None, "pinned"
+        usable = [r for r in self.replicas if r.healthy and r.lag_seconds is not None]
+        if not usable:
+            return None, "unavailable"
+        usable = [r for r in usable if r.lag_seconds <= self.max_lag]
+        if not usable:
+            return None, "lagging"
+        self._next = (self._next + 1) % len(usable)
+        return usable[self._next], ""
+
+    async def _monitor_loop(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+
+async def open_replicas(
+    dsns: List[Tuple[str, str]],
+    budget: ConnectionBudget,
+    **pool_kwargs: Any
+) -> List[Replica]:
+    """Open one pool per (name, dsn)
+
+    A replica that cannot be reached yet still gets a pool, opened empty, so
+    reads start going to it once its lag checks succeed.
+    """
+    replicas = []
+    for name, dsn in dsns:
+        try:
+            pool = await create_pool(dsn, budget, **pool_kwargs)
+        except Exception as e:
+            logger.warning(f"Could not connect to replica {name}, reading from primary until it is up: {e}")
+            pool = await create_pool(dsn, budget, **{**pool_kwargs, "min_size": 0})
+        replicas.append(Replica(name, pool))
+    return replicas
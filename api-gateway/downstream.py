@@ -0,0 +1,560 @@
+"""
+Downstream service calls for the API Gateway
+A registry of downstream services, each with its own connection pool,
+circuit breaker, latency-adaptive timeout and optional request hedging, so
+a dead or slow dependency costs microseconds, not seconds, one slow pod does
+not set the tail, and one busy target cannot starve the others
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+
+try:
+    import h2  # HTTP/2 support for httpx (httpx[http2])
+except ImportError:
+    h2 = None
+
+from metrics import Histogram, LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a service whose circuit is open"""
+
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(f"Circuit open for {service}; retry in {retry_after:.1f}s")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a sliding window of calls
+
+    Closed: calls go through and their outcomes fill a window of the last
+    `window` calls. Once it holds at least `min_calls`, the circuit opens
+    when the share of failures reaches `failure_rate` or the share of calls
+    slower than `slow_call_ms` reaches `slow_call_rate`.
+
+    Open: allow() raises CircuitOpen straight away - a clock read and a
+    comparison - for `open_seconds`, then the breaker turns half-open.
+
+    Half-open: up to `half_open_calls` trial calls go through. Any failed or
+    slow trial reopens the circuit; that many successes close it again.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_rate: float = 0.5,
+        slow_call_ms: float = 1000.0,
+        open_seconds: float = 10.0,
+        half_open_calls: int = 3
+    ):
+        self.service = service
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_ms = slow_call_ms
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        # (failed, slow) per call, newest last
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._failures = 0
+        self._slow = 0
+        self._open_until = 0.0
+        self._trials_in_flight = 0
+        self._trial_successes = 0
+
+        self.calls = 0
+        self.rejected = 0
+        self.opened = 0
+        self.changed_at = time.time()
+
+    def allow(self) -> bool:
+        """Admit one call or raise CircuitOpen; True if it is a half-open trial
+
+        The returned flag must be handed back to record() or release().
+        """
+        if self.state == OPEN:
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(self.service, remaining)
+            self._transition(HALF_OPEN)
+            self._trials_in_flight = 0
+            self._trial_successes = 0
+
+        if self.state == HALF_OPEN:
+            if self._trials_in_flight >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpen(self.service, 0.0)
+            self._trials_in_flight += 1
+            return True
+        return False
+
+    def record(self, ok: bool, duration_ms: float, trial: bool = False) -> None:
+        """Record the outcome of a call admitted by allow()"""
+        self.calls += 1
+        slow = duration_ms > self.slow_call_ms
+
+        if trial:
+            if self.state != HALF_OPEN:
+                return
+            self._trials_in_flight -= 1
+            if not ok or slow:
+                self._open()
+            else:
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    self._close()
+            return
+
+        # Calls started before the circuit opened say nothing new
+        if self.state != CLOSED:
+            return
+
+        if len(self._window) == self._window.maxlen:
+            old_failed, old_slow = self._window[0]
+            self._failures -= old_failed
+            self._slow -= old_slow
+        self._window.append((not ok, slow))
+        self._failures += not ok
+        self._slow += slow
+
+        n = len(self._window)
+        if n >= self.min_calls and (
+            self._failures / n >= self.failure_rate or self._slow / n >= self.slow_call_rate
+        ):
+            self._open()
+
+    def release(self, trial: bool) -> None:
+        """Give back an admitted call that was abandoned without an outcome"""
+        if trial and self.state == HALF_OPEN and self._trials_in_flight > 0:
+            self._trials_in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        n = len(self._window)
+        return {
+            "state": self.state,
+            "since": self.changed_at,
+            "retry_after_seconds": round(max(0.0, self._open_until - time.monotonic()), 3) if self.state == OPEN else 0.0,
+            "window_calls": n,
+            "failure_rate": round(self._failures / n, 3) if n else 0.0,
+            "slow_call_rate": round(self._slow / n, 3) if n else 0.0,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "thresholds": {
+                "min_calls": self.min_calls,
+                "failure_rate": self.failure_rate,
+                "slow_call_rate": self.slow_call_rate,
+                "slow_call_ms": self.slow_call_ms,
+                "open_seconds": self.open_seconds,
+                "half_open_calls": self.half_open_calls
+            }
+        }
+
+    def _open(self) -> None:
+        self._open_until = time.monotonic() + self.open_seconds
+        self.opened += 1
+        self._transition(OPEN)
+        logger.warning(f"Circuit for {self.service} opened for {self.open_seconds:.0f}s")
+
+    def _close(self) -> None:
+        self._window.clear()
+        self._failures = 0
+        self._slow = 0
+        self._transition(CLOSED)
+        logger.info(f"Circuit for {self.service} closed")
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        self.changed_at = time.time()
+
+
+class AdaptiveTimeout:
+    """Per-call timeout that follows a service's recent latency
+
+    multiplier x the percentile-th latency of the last calls, clamped to
+    [minimum, maximum]. Until min_samples calls have been seen the timeout
+    is `maximum`, so a cold service is not cut short.
+
+    A call that timed out, or a hedged call cancelled because its hedge
+    answered first, is recorded by censor() at the timeout it had: its
+    real latency is unknown, and recording only the calls that finished
+    would let the timeout ratchet down until a service that slowed down
+    could never answer in time. Censored samples in the tail instead double
+    the timeout until calls complete again.
+    """
+
+    def __init__(
+        self,
+        maximum: float = 5.0,
+        minimum: float = 0.1,
+        percentile: float = 99.0,
+        multiplier: float = 2.0,
+        min_samples: int = 20,
+        window: int = 256
+    ):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.latency = LatencyWindow(window)
+
+    def observe(self, ms: float) -> None:
+        self.latency.observe(ms)
+
+    def censor(self, seconds: float) -> None:
+        """Record a call abandoned after `seconds` with no answer"""
+        self.latency.observe(seconds * 1000)
+
+    def current(self) -> float:
+        """Timeout in seconds for the next call"""
+        if len(self.latency) < self.min_samples:
+            return self.maximum
+        seconds = self.latency.percentile(self.percentile) * self.multiplier / 1000
+        return min(self.maximum, max(self.minimum, seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "current_seconds": round(self.current(), 3),
+            "minimum_seconds": self.minimum,
+            "maximum_seconds": self.maximum,
+            "rule": f"{self.multiplier:g} x p{self.percentile:g}",
+            "latency": self.latency.stats()
+        }
+
+
+class HedgePolicy:
+    """When, and how often, to hedge a slow idempotent request
+
+    A hedge is a second copy of a request still unanswered after the
+    service's recent `percentile`-th latency. Every request earns
+    `budget_percent`/100 of a token and every hedge spends one, so hedges stay
+    under that share of traffic; at most `burst` tokens bank up while the
+    service is fast.
+    """
+
+    def __init__(self, percentile: float = 95.0, budget_percent: float = 5.0, burst: float = 10.0):
+        self.percentile = percentile
+        self.ratio = budget_percent / 100
+        self.burst = burst
+        self.tokens = burst
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+
+    def earn(self) -> None:
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        if self.tokens < 1:
+            self.denied += 1
+            return False
+        self.tokens -= 1
+        self.hedges += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "percentile": self.percentile,
+            "budget_percent": round(self.ratio * 100, 3),
+            "tokens": round(self.tokens, 2),
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_rate": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "denied_by_budget": self.denied
+        }
+
+
+class ServicePool:
+    """Connection pool for one downstream service, with wait and reuse metrics
+
+    Each service gets its own limits, so a slow target that holds all its
+    connections only queues its own requests. HTTP/2 is negotiated via TLS
+    ALPN when enabled and `h2` is installed; plain-http targets and servers
+    without HTTP/2 stay on HTTP/1.1.
+
+    Pool wait and reuse come from httpcore's trace events: the time until
+    a request starts connecting (new connection) or sending headers (reused
+    connection) is the time it waited for the pool.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 5.0,
+        http2: bool = False
+    ):
+        if http2 and h2 is None:
+            logger.warning("HTTP/2 requested but h2 is not installed; using HTTP/1.1")
+            http2 = False
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_keepalive, max_connections),
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http2 = http2
+        self.client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+
+        self.wait = Histogram()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused = 0
+        self.pool_timeouts = 0
+        self.http_versions: Dict[str, int] = {}
+
+    def start(self) -> None:
+        """Create the client; connections are opened on demand"""
+        if self.client is None:
+            self._transport = httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+            self.client = httpx.AsyncClient(transport=self._transport)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            self._transport = None
+
+    async def get(self, url: str, timeout: float, **kwargs) -> httpx.Response:
+        if self.client is None:
+            raise RuntimeError("Service pool not started")
+        started = time.perf_counter()
+        assigned = False
+
+        async def trace(event: str, info: Dict[str, Any]) -> None:
+            nonlocal assigned
+            if assigned:
+                return
+            if event == "connection.connect_tcp.started":
+                self.new_connections += 1
+            elif event.endswith(".send_request_headers.started"):
+                self.reused += 1
+            else:
+                return
+            assigned = True
+            self.wait.observe((time.perf_counter() - started) * 1000)
+
+        self.requests += 1
+        try:
+            response = await self.client.get(url, timeout=timeout, extensions={"trace": trace}, **kwargs)
+        except httpx.PoolTimeout:
+            self.pool_timeouts += 1
+            raise
+        self.http_versions[response.http_version] = self.http_versions.get(response.http_version, 0) + 1
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        # httpx does not expose its pool; read it when available
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for c in connections if c.is_idle())
+        assigned = self.new_connections + self.reused
+        return {
+            "max_connections": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "keepalive_expiry_seconds": self.limits.keepalive_expiry,
+            "http2": self.http2,
+            "open_connections": len(connections),
+            "idle_connections": idle,
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused,
+            "reuse_ratio": round(self.reused / assigned, 4) if assigned else 0.0,
+            "pool_timeouts": self.pool_timeouts,
+            "http_versions": self.http_versions,
+            "pool_wait": self.wait.stats()
+        }
+
+
+class Downstream:
+    """One downstream service: endpoints, pool, adaptive timeout, optional breaker
+
+    get() fails fast with CircuitOpen while the breaker is open. Transport
+    errors, timeouts and 5xx responses count as failures; 5xx responses are
+    still returned for the caller to handle. Requests rotate over `endpoints`.
+
+    With a HedgePolicy, a GET still unanswered after the policy's latency
+    percentile is sent again to the next endpoint; the first reply wins and
+    the other attempt is cancelled. Only pass one for idempotent reads.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        endpoints: Sequence[str],
+        timeout: AdaptiveTimeout,
+        breaker: Optional[CircuitBreaker] = None,
+        hedging: Optional[HedgePolicy] = None,
+        pool: Optional[ServicePool] = None
+    ):
+        self.name = name
+        self.endpoints = [url.rstrip("/") for url in endpoints]
+        self.timeout = timeout
+        self.breaker = breaker
+        self.hedging = hedging
+        self.pool = pool or ServicePool()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self._next = 0
+
+    def start(self) -> None:
+        self.pool.start()
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def get(self, path: str = "", **kwargs) -> httpx.Response:
+        """GET path from the next endpoint within the adaptive timeout"""
+        trial = self.breaker.allow() if self.breaker else False
+        # A recovery trial gets the full timeout: if the service's latency has
+        # shifted up, its old percentiles would cut every trial short
+        timeout = self.timeout.maximum if trial else self.timeout.current()
+        endpoint = self._next
+        self._next = (self._next + 1) % len(self.endpoints)
+
+        hedging = self.hedging
+        if hedging is None or trial:
+            return await self._attempt(endpoint, path, timeout, trial, kwargs)
+        hedging.earn()
+        if len(self.timeout.latency) < self.timeout.min_samples:
+            return await self._attempt(endpoint, path, timeout, trial, kwargs)
+
+        primary = asyncio.ensure_future(self._attempt(endpoint, path, timeout, trial, kwargs))
+        hedge: Optional["asyncio.Future[httpx.Response]"] = None
+        try:
+            delay = self.timeout.latency.percentile(hedging.percentile) / 1000
+            done, _ = await asyncio.wait((primary,), timeout=delay)
+            if done or not hedging.spend():
+                return await primary
+            try:
+                hedge_trial = self.breaker.allow() if self.breaker else False
+            except CircuitOpen:
+                return await primary
+
+            hedge = asyncio.ensure_future(self._attempt(
+                (endpoint + 1) % len(self.endpoints), path, timeout, hedge_trial, kwargs
+            ))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            hedging.hedge_wins += 1
+                            if not primary.done():
+                                # The primary's latency is unknown, only that
+                                # it exceeded the hedge delay; recording the
+                                # elapsed time would pull the tail down to it
+                                self.timeout.censor(timeout)
+                        return task.result()
+            # Both attempts failed: report the original request's error
+            return primary.result()
+        finally:
+            # Cancel the loser (or both, if the caller went away)
+            losers = [task for task in (primary, hedge) if task is not None and not task.done()]
+            for task in losers:
+                task.cancel()
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+
+    async def _attempt(
+        self,
+        endpoint: int,
+        path: str,
+        timeout: float,
+        trial: bool,
+        kwargs: Dict[str, Any]
+    ) -> httpx.Response:
+        self.calls += 1
+        started = time.perf_counter()
+        try:
+            response = await self.pool.get(f"{self.endpoints[endpoint]}{path}", timeout, **kwargs)
+        except asyncio.CancelledError:
+            if self.breaker:
+                self.breaker.release(trial)
+            raise
+        except Exception as e:
+            self.failures += 1
+            if isinstance(e, httpx.TimeoutException):
+                self.timeouts += 1
+                # A pool wait says nothing about the service's latency
+                if not isinstance(e, httpx.PoolTimeout):
+                    self.timeout.censor(timeout)
+            if self.breaker:
+                self.breaker.record(False, (time.perf_counter() - started) * 1000, trial)
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ok = response.status_code < 500
+        if ok:
+            self.timeout.observe(elapsed_ms)
+        else:
+            self.failures += 1
+        if self.breaker:
+            self.breaker.record(ok, elapsed_ms, trial)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoints": self.endpoints,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "timeout": self.timeout.stats(),
+            "circuit": self.breaker.stats() if self.breaker else None,
+            "hedging": self.hedging.stats() if self.hedging else None,
+            "pool": self.pool.stats()
+        }
+
+
+class ServiceRegistry:
+    """Downstream services by name; starts and closes their pools together"""
+
+    def __init__(self, services: Iterable[Downstream]):
+        self._services: Dict[str, Downstream] = {s.name: s for s in services}
+        self.started = False
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._services
+
+    def __getitem__(self, name: str) -> Downstream:
+        return self._services[name]
+
+    def names(self) -> List[str]:
+        return list(self._services)
+
+    def start(self) -> None:
+        for service in self._services.values():
+            service.start()
+        self.started = True
+
+    async def close(self) -> None:
+        self.started = False
+        await asyncio.gather(*(s.close() for s in self._services.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: s.stats() for name, s in self._services.items()}
@@ -0,0 +1,44 @@
+"""
+Production launcher settings: several uvicorn worker processes under gunicorn
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Each worker imports the app itself and opens its own Redis, PostgreSQL and
+HTTP pools in the lifespan (nothing is shared across the fork), sized by
+main.py so that all workers together stay within the configured budgets.
+`kill -HUP <master pid>` replaces every worker gracefully, picking up new
+code and settings without dropping connections.
+"""
+
+import os
+
+from workers import auto_workers
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 8000)}"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# WEB_CONCURRENCY pins the worker count; otherwise one per CPU of the cgroup
+# quota (at least WORKERS_MIN). Workers read it back to split the budgets.
+workers = int(os.getenv("WEB_CONCURRENCY") or auto_workers(
+    min_workers=int(os.getenv("WORKERS_MIN", 2)),
+    max_workers=int(os.getenv("WORKERS_MAX", 0))
+))
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# Shared-nothing workers: load the app after fork, never in the master
+preload_app = False
+
+# Recycle a worker after this many requests; the jitter staggers restarts
+# so workers do not all recycle at once. Memory-based recycling is done in
+# the app (WORKER_MAX_MEMORY_MB).
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", 1000))
+
+# A recycled or HUP-replaced worker gets this long to finish in-flight
+# requests; keep it below the pod's terminationGracePeriodSeconds
+graceful_timeout = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+keepalive = int(os.getenv("KEEPALIVE_TIMEOUT", 5))
+
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+accesslog = "-"
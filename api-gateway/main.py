@@ -3,23 +3,48 @@ Minimal API Gateway Service for Datadog APM Demo
 Fast track implementation with basic endpoints for distributed tracing
 """
 
+import io
 import os
+import csv
+import json
+import uuid
+import base64
+import hashlib
 import asyncio
 import logging
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import random
 
-from fastapi import FastAPI, HTTPException, status
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, Header, HTTPException, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
 from contextlib import asynccontextmanager
 
-import httpx
-import redis
-import asyncpg
+import redis.asyncio as aioredis
 from dotenv import load_dotenv
 
+from cache import LocalCache, SingleFlight, RedisBatcher
+from cache_codec import CacheCodec
+from catalog import ProductCatalog, CatalogChangeListener, Product, PRODUCT_COLUMNS
+from serialization import FastJSONResponse, dumps
+from workers import MemoryWatchdog, pool_share
+from downstream import AdaptiveTimeout, CircuitBreaker, CircuitOpen, Downstream, HedgePolicy, ServicePool, ServiceRegistry
+from database import ConnectionBudget, MeteredPool, ReplicaRouter, create_pool, open_replicas, queries
+from orders import (
+    OrderOrchestrator,
+    OrderStep,
+    OrderFailed,
+    ReservationError,
+    ProductNotFound,
+    InsufficientStock,
+    ReservationReaper,
+    commit_reservation,
+    fetch_product,
+    release_reservation,
+    reserve_stock
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -31,25 +56,186 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Global connections
-redis_client: Optional[redis.Redis] = None
-db_pool: Optional[asyncpg.Pool] = None
-http_client: Optional[httpx.AsyncClient] = None
+redis_client: Optional[aioredis.Redis] = None
+db_pool: Optional[MeteredPool] = None
+read_pool: Optional[ReplicaRouter] = None
+reservation_reaper: Optional[ReservationReaper] = None
+product_catalog: Optional[ProductCatalog] = None
+redis_batcher: Optional[RedisBatcher] = None
+catalog_listener: Optional[CatalogChangeListener] = None
+memory_watchdog: Optional[MemoryWatchdog] = None
+
+# Worker processes serving this pod: set by gunicorn.conf.py, 1 under plain
+# uvicorn. Each worker opens its own pools, so the per-pod Redis and HTTP
+# budgets below are split evenly across workers.
+WORKER_COUNT = int(os.getenv("WEB_CONCURRENCY", 1))
+CHANGE_LISTENER_ENABLED = os.getenv("CHANGE_LISTENER_ENABLED", "true").lower() == "true"
+
+# PostgreSQL connections are budgeted for the whole deployment: every
+# worker of every replica gets an equal share, its LISTEN connection included
+DB_BUDGET = ConnectionBudget(
+    total=int(os.getenv("DB_CONNECTION_BUDGET", 20)),
+    replicas=int(os.getenv("GATEWAY_REPLICAS", 1)),
+    workers=WORKER_COUNT,
+    reserved=1 if CHANGE_LISTENER_ENABLED else 0
+)
+# Read replicas, "host[:port]" comma-separated; empty = all reads on the
+# primary. Each replica server gets its own budget, split the same way.
+POSTGRES_REPLICA_HOSTS = [h.strip() for h in os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",") if h.strip()]
+DB_REPLICA_BUDGET = ConnectionBudget(
+    total=int(os.getenv("DB_REPLICA_CONNECTION_BUDGET", os.getenv("DB_CONNECTION_BUDGET", 20))),
+    replicas=int(os.getenv("GATEWAY_REPLICAS", 1)),
+    workers=WORKER_COUNT
+)
+
+REDIS_POOL_SIZE = pool_share(int(os.getenv("REDIS_MAX_CONNECTIONS", 20)), WORKER_COUNT)
+# Default connection pool per downstream service (not shared between them)
+HTTP_POOL_SIZE = pool_share(int(os.getenv("HTTP_CONNECTION_POOL_SIZE", 100)), WORKER_COUNT)
+
+# Downstream calls: each service gets its own connection pool, circuit
+# breaker and a timeout of DOWNSTREAM_TIMEOUT_MULTIPLIER x its recent
+# p<PERCENTILE> latency, clamped to [DOWNSTREAM_TIMEOUT_MIN, DOWNSTREAM_TIMEOUT].
+# Service URLs may list several endpoints, comma-separated; requests rotate
+# over them. Pool settings default to DOWNSTREAM_<SETTING> and can be set per
+# service as <SERVICE>_<SETTING> (e.g. PRICING_MAX_CONNECTIONS, INVENTORY_HTTP2).
+DOWNSTREAM_SERVICES = {
+    "inventory": {"url": os.getenv("INVENTORY_SERVICE_URL", "http://inventory-service:8001"), "http2": False},
+    "pricing": {"url": os.getenv("PRICING_SERVICE_URL", "http://pricing-service:8002"), "http2": False},
+    # External service for testing; negotiates HTTP/2 over TLS
+    "external": {"url": "https://httpbin.org", "http2": True}
+}
+ENABLE_CIRCUIT_BREAKER = os.getenv("ENABLE_CIRCUIT_BREAKER", "true").lower() == "true"
+# Opt-in request hedging (idempotent GETs only): a request still unanswered
+# after the service's p<HEDGE_PERCENTILE> is repeated on the next endpoint,
+# within HEDGE_BUDGET_PERCENT extra requests
+HEDGE_SERVICES = {s.strip() for s in os.getenv("HEDGE_SERVICES", "").split(",") if s.strip()}
+
+
+def service_setting(name: str, setting: str, default: Any) -> str:
+    """<SERVICE>_<SETTING>, else DOWNSTREAM_<SETTING>, else the default"""
+    return os.getenv(f"{name.upper()}_{setting}", os.getenv(f"DOWNSTREAM_{setting}", str(default)))
+
+
+def build_downstream(name: str, url: str, http2: bool = False) -> Downstream:
+    """Downstream wrapper for one service, configured from the environment"""
+    pool = ServicePool(
+        max_connections=int(service_setting(name, "MAX_CONNECTIONS", HTTP_POOL_SIZE)),
+        max_keepalive=int(service_setting(name, "MAX_KEEPALIVE", 20)),
+        keepalive_expiry=float(service_setting(name, "KEEPALIVE_EXPIRY", 4.0)),
+        http2=service_setting(name, "HTTP2", http2).lower() == "true"
+    )
+    breaker = CircuitBreaker(
+        name,
+        window=int(os.getenv("CIRCUIT_BREAKER_WINDOW", 20)),
+        min_calls=int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", 5)),
+        failure_rate=float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", 0.5)),
+        slow_call_rate=float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_RATE", 0.5)),
+        slow_call_ms=float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_MS", 1000)),
+        open_seconds=float(os.getenv("CIRCUIT_BREAKER_TIMEOUT", 10)),
+        half_open_calls=int(os.getenv("CIRCUIT_BREAKER_HALF_OPEN_CALLS", 3))
+    ) if ENABLE_CIRCUIT_BREAKER else None
+    timeout = AdaptiveTimeout(
+        maximum=float(os.getenv("DOWNSTREAM_TIMEOUT", 5.0)),
+        minimum=float(os.getenv("DOWNSTREAM_TIMEOUT_MIN", 0.1)),
+        percentile=float(os.getenv("DOWNSTREAM_TIMEOUT_PERCENTILE", 99)),
+        multiplier=float(os.getenv("DOWNSTREAM_TIMEOUT_MULTIPLIER", 2.0)),
+        min_samples=int(os.getenv("DOWNSTREAM_TIMEOUT_MIN_SAMPLES", 20))
+    )
+    hedging = HedgePolicy(
+        percentile=float(os.getenv("HEDGE_PERCENTILE", 95)),
+        budget_percent=float(os.getenv("HEDGE_BUDGET_PERCENT", 5))
+    ) if name in HEDGE_SERVICES else None
+    endpoints = [u.strip() for u in url.split(",") if u.strip()]
+    return Downstream(name, endpoints, timeout, breaker, hedging, pool)
+
+
+services = ServiceRegistry(
+    build_downstream(name, config["url"], config["http2"]) for name, config in DOWNSTREAM_SERVICES.items()
+)
+
+# Restart this worker gracefully once its RSS passes this (0 = never)
+WORKER_MAX_MEMORY_MB = int(os.getenv("WORKER_MAX_MEMORY_MB", 0))
+
+# Cache settings: Redis keeps products and the SKU index for CACHE_TTL; the
+# index is rebuilt in the background once it is older than CACHE_SOFT_TTL
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+CACHE_SOFT_TTL = int(os.getenv("CACHE_SOFT_TTL", 240))
+CACHE_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", 1.0))
+
+# Hard cap on /products page size so any page costs the same as the first
+PRODUCTS_MAX_PAGE_SIZE = int(os.getenv("PRODUCTS_MAX_PAGE_SIZE", 100))
+
+# Maximum number of ids/SKUs accepted by /products/batch
+PRODUCTS_BATCH_MAX = int(os.getenv("PRODUCTS_BATCH_MAX", 100))
+
+# Rows fetched per server-side cursor round-trip by /products/export
+EXPORT_PREFETCH = int(os.getenv("EXPORT_PREFETCH", 500))
+
+# In-process L1 tier checked before Redis; TTL must stay well below CACHE_TTL
+local_cache = LocalCache(
+    max_entries=int(os.getenv("L1_CACHE_MAX_ENTRIES", 256)),
+    max_bytes=int(os.getenv("L1_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+    ttl=float(os.getenv("L1_CACHE_TTL", 5.0))
+)
+
+# How long an encoded /products page body stays in Redis; bodies are also
+# dropped as soon as any product or the index is invalidated
+PAGE_BODY_TTL = int(os.getenv("PAGE_BODY_TTL", 60))
+
+# Cache-Control sent with catalog responses; the default makes clients
+# revalidate every time, which is a cheap 304 when nothing changed
+PRODUCTS_CACHE_CONTROL = os.getenv("PRODUCTS_CACHE_CONTROL", "no-cache")
+TEST_DB_CACHE_CONTROL = os.getenv("TEST_DB_CACHE_CONTROL", "no-cache")
+
+# Body-cache key under which /test-db remembers its last ETag
+TEST_DB_BODY_KEY = "test-db"
+
+# Coalesces concurrent assemblies of the same /products page
+product_loads = SingleFlight()
 
 
 # Pydantic models
 class HealthResponse(BaseModel):
     status: str
     service: str = "api-gateway"
-    timestamp: str
+    timestamp: datetime
     version: str = "1.0.0"
 
 
 class ProductResponse(BaseModel):
-    id: int
+    # Validated straight from catalog.Product attributes
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
     sku: str
     name: str
     stock_level: int
     price: float
+    discounted_price: float
+
+
+class ProductListResponse(BaseModel):
+    products: List[ProductResponse]
+    next_cursor: Optional[str] = None
+    stale: bool
+    timestamp: datetime
+
+
+class ProductBatchResponse(BaseModel):
+    products: List[ProductResponse]
+    missing: List[str]
+    requested: int
+    cache_hits: int
+    timestamp: datetime
+
+
+class DatabaseTestResponse(BaseModel):
+    status: str
+    database: str
+    version: str
+    sample_products: List[ProductResponse]
+    product_count: int
+    timestamp: datetime
 
 
 class CacheTestResponse(BaseModel):
@@ -57,7 +243,7 @@ class CacheTestResponse(BaseModel):
     value: str
     ttl: int
     operation: str
-    timestamp: str
+    timestamp: datetime
 
 
 class ServiceCallResponse(BaseModel):
@@ -65,71 +251,186 @@ class ServiceCallResponse(BaseModel):
     target: str
     status: str
     data: Dict[str, Any]
-    timestamp: str
+    timestamp: datetime
+
+
+def pin_primary_reads() -> None:
+    """Products are about to change in the cache: read them from the primary
+
+    Replicas may not have replayed the change yet, so reads stay on the
+    primary for up to the tolerated lag. This runs before the Redis
+    eviction, so no miss after it can be refilled from a replica.
+    """
+    if read_pool:
+        read_pool.pin_primary()
+
+
+def on_catalog_change() -> None:
+    """Products were evicted from Redis: drop L1 so it reloads them too"""
+    local_cache.clear()
 
 
 # Lifecycle management
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifecycle - startup and shutdown"""
-    global redis_client, db_pool, http_client
+    global redis_client, db_pool, reservation_reaper, product_catalog, catalog_listener
+    global redis_batcher, memory_watchdog, read_pool
 
     # Startup
-    logger.info("Starting API Gateway...")
+    logger.info(
+        f"Starting API Gateway worker {os.getpid()} ({WORKER_COUNT} per pod; pools: "
+        f"postgres {DB_BUDGET.pool_size}, redis {REDIS_POOL_SIZE}, http {HTTP_POOL_SIZE})"
+    )
 
     # Initialize Redis connection
     try:
         redis_host = os.getenv("REDIS_HOST", "localhost")
         redis_port = int(os.getenv("REDIS_PORT", 6379))
-        redis_client = redis.Redis(
+        # Bounded pool: when every connection is busy, callers wait up to
+        # REDIS_POOL_TIMEOUT for one to free up instead of opening more.
+        redis_pool = aioredis.BlockingConnectionPool(
             host=redis_host,
             port=redis_port,
             decode_responses=True,
-            socket_connect_timeout=5
+            max_connections=REDIS_POOL_SIZE,
+            timeout=float(os.getenv("REDIS_POOL_TIMEOUT", 2.0)),
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 5.0)),
+            socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 1.0)),
+            health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
         )
-        redis_client.ping()
+        redis_client = aioredis.Redis(connection_pool=redis_pool)
+        await redis_client.ping()
         logger.info(f"Connected to Redis at {redis_host}:{redis_port}")
     except Exception as e:
         logger.warning(f"Could not connect to Redis: {e}")
+        if redis_client:
+            await redis_client.aclose(close_connection_pool=True)
         redis_client = None
 
+    # Related Redis commands share one pipelined round-trip; with
+    # REDIS_AUTO_BATCH, so do commands from concurrent requests
+    if redis_client:
+        redis_batcher = RedisBatcher(
+            redis_client,
+            auto_batch=os.getenv("REDIS_AUTO_BATCH", "false").lower() == "true",
+            window=float(os.getenv("REDIS_BATCH_WINDOW", 0.0005)),
+            max_batch=int(os.getenv("REDIS_BATCH_MAX", 256))
+        )
+
     # Initialize PostgreSQL connection pool
+    db_credentials = f"{os.getenv('POSTGRES_USER', 'postgres')}:{os.getenv('POSTGRES_PASSWORD', 'postgres')}"
+    db_name = os.getenv("POSTGRES_DB", "inventory")
+    pool_settings = dict(
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+        acquire_timeout=float(os.getenv("DB_ACQUIRE_TIMEOUT", 5.0)),
+        max_queries=int(os.getenv("DB_MAX_QUERIES", 50000)),
+        max_inactive_connection_lifetime=float(os.getenv("DB_MAX_INACTIVE_LIFETIME", 300.0)),
+        command_timeout=10
+    )
     try:
         db_url = (
-            f"postgresql://"
-            f"{os.getenv('POSTGRES_USER', 'postgres')}:"
-            f"{os.getenv('POSTGRES_PASSWORD', 'postgres')}@"
+            f"postgresql://{db_credentials}@"
             f"{os.getenv('POSTGRES_HOST', 'localhost')}:"
-            f"{os.getenv('POSTGRES_PORT', 5432)}/"
-            f"{os.getenv('POSTGRES_DB', 'inventory')}"
-        )
-        db_pool = await asyncpg.create_pool(
-            db_url,
-            min_size=2,
-            max_size=10,
-            command_timeout=10
+            f"{os.getenv('POSTGRES_PORT', 5432)}/{db_name}"
         )
+        db_pool = await create_pool(db_url, DB_BUDGET, **pool_settings)
         logger.info("Connected to PostgreSQL")
     except Exception as e:
         logger.warning(f"Could not connect to PostgreSQL: {e}")
         db_pool = None
 
-    # Initialize HTTP client for service-to-service calls
-    http_client = httpx.AsyncClient(timeout=30.0)
+    # Read-only work (catalog, exports) goes to replicas that keep up with
+    # the primary; orders, reservations and the reaper write to db_pool
+    if db_pool:
+        replicas = await open_replicas(
+            [(host, f"postgresql://{db_credentials}@{host}/{db_name}") for host in POSTGRES_REPLICA_HOSTS],
+            DB_REPLICA_BUDGET,
+            **pool_settings
+        )
+        read_pool = ReplicaRouter(
+            db_pool,
+            replicas,
+            max_lag=float(os.getenv("DB_REPLICA_MAX_LAG", 1.0)),
+            check_interval=float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 1.0))
+        )
+        await read_pool.check()
+        read_pool.start()
+
+    # Product reads: per-product Redis entries in front of PostgreSQL
+    product_catalog = ProductCatalog(
+        read_pool,
+        redis_client,
+        ttl=CACHE_TTL,
+        soft_ttl=CACHE_SOFT_TTL,
+        xfetch_beta=CACHE_XFETCH_BETA,
+        batcher=redis_batcher,
+        body_ttl=PAGE_BODY_TTL,
+        codec=CacheCodec(
+            serializer=os.getenv("CACHE_CODEC", "orjson").lower(),
+            compression=os.getenv("CACHE_COMPRESSION", "none").lower(),
+            compress_min_bytes=int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 1024))
+        )
+    )
+
+    # Evict cached products as soon as PostgreSQL reports them changed
+    if db_pool and redis_client and CHANGE_LISTENER_ENABLED:
+        catalog_listener = CatalogChangeListener(
+            db_url,
+            product_catalog,
+            before_invalidate=pin_primary_reads,
+            on_invalidate=on_catalog_change
+        )
+        catalog_listener.start()
+
+    # Release expired stock reservations in the background
+    if db_pool and os.getenv("REAPER_ENABLED", "true").lower() == "true":
+        reservation_reaper = ReservationReaper(
+            db_pool,
+            interval=float(os.getenv("REAPER_INTERVAL", 30.0)),
+            batch_size=int(os.getenv("REAPER_BATCH_SIZE", 100))
+        )
+        reservation_reaper.start()
+
+    # Per-service HTTP connection pools for service-to-service calls
+    services.start()
+
+    if WORKER_MAX_MEMORY_MB > 0:
+        memory_watchdog = MemoryWatchdog(
+            WORKER_MAX_MEMORY_MB * 1024 * 1024,
+            interval=float(os.getenv("WORKER_MEMORY_CHECK_INTERVAL", 10.0))
+        )
+        memory_watchdog.start()
 
     yield
 
     # Shutdown
-    logger.info("Shutting down API Gateway...")
+    logger.info(f"Shutting down API Gateway worker {os.getpid()}...")
+
+    if memory_watchdog:
+        await memory_watchdog.stop()
+
+    if catalog_listener:
+        await catalog_listener.stop()
+
+    await product_catalog.close()
+
+    if read_pool:
+        await read_pool.close()
+
+    if reservation_reaper:
+        await reservation_reaper.stop()
+
+    if redis_batcher:
+        await redis_batcher.close()
 
     if redis_client:
-        redis_client.close()
+        await redis_client.aclose(close_connection_pool=True)
 
     if db_pool:
         await db_pool.close()
 
-    if http_client:
-        await http_client.aclose()
+    await services.close()
 
 
 # Create FastAPI app
@@ -137,10 +438,47 @@ app = FastAPI(
     title="API Gateway",
     description="Minimal API Gateway for Datadog APM Demo",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 
+def strong_etag(body: bytes) -> str:
+    """Strong ETag: a hash of the exact response bytes"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for it)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in candidates)
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """304 for a client whose cached copy is still current"""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": cache_control}
+    )
+
+
+def encoded_response(
+    body: bytes,
+    etag: str,
+    cache_status: Optional[str] = None,
+    cache_control: str = PRODUCTS_CACHE_CONTROL
+) -> Response:
+    """Send a pre-encoded JSON body as-is, skipping validation and re-encoding"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if cache_status:
+        headers["X-Cache"] = cache_status
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # Endpoints
 @app.get("/", response_model=Dict[str, str])
 async def root():
@@ -157,13 +495,26 @@ async def health_check():
     """Health check endpoint"""
     return HealthResponse(
         status="healthy",
-        timestamp=datetime.utcnow().isoformat()
+        timestamp=datetime.utcnow()
     )
 
 
-@app.get("/test-db", response_model=Dict[str, Any])
-async def test_database():
-    """Test PostgreSQL connection and query sample data"""
+SERVER_VERSION = queries.register("test_db.server_version", "SELECT version()")
+SAMPLE_PRODUCTS = queries.register(
+    "test_db.sample_products",
+    f"SELECT {PRODUCT_COLUMNS} "
+    "FROM inventory.products "
+    "LIMIT 5"
+)
+
+
+@app.get("/test-db", response_model=DatabaseTestResponse)
+async def test_database(if_none_match: Optional[str] = Header(None)):
+    """Test PostgreSQL connection and query sample data
+
+    The body's ETag is remembered against the catalog version, so a client
+    revalidating with If-None-Match gets a 304 until a product changes.
+    """
     global db_pool
 
     if not db_pool:
@@ -172,41 +523,34 @@ async def test_database():
             detail="Database connection not available"
         )
 
+    current_etag, catalog_version = await product_catalog.get_etag(TEST_DB_BODY_KEY)
+    if etag_matches(if_none_match, current_etag):
+        return not_modified(current_etag, TEST_DB_CACHE_CONTROL)
+
     try:
         async with db_pool.acquire() as conn:
             # Test connection with a simple query
-            version = await conn.fetchval("SELECT version()")
+            version = await SERVER_VERSION.fetchval(conn)
 
             # Try to fetch some products (if table exists)
             try:
-                products = await conn.fetch(
-                    "SELECT id, sku, name, stock_level, price "
-                    "FROM inventory.products "
-                    "LIMIT 5"
-                )
-
-                product_list = [
-                    {
-                        "id": str(p["id"]),
-                        "sku": p["sku"],
-                        "name": p["name"],
-                        "stock_level": p["stock_level"],
-                        "price": float(p["price"]) if p["price"] else 0
-                    }
-                    for p in products
-                ]
+                products = await SAMPLE_PRODUCTS.fetch(conn)
+                product_list = [Product.from_record(p) for p in products]
             except Exception as e:
                 logger.warning(f"Could not fetch products: {e}")
                 product_list = []
 
-            return {
-                "status": "connected",
-                "database": "PostgreSQL",
-                "version": version,
-                "sample_products": product_list,
-                "product_count": len(product_list),
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            body = DatabaseTestResponse(
+                status="connected",
+                database="PostgreSQL",
+                version=version,
+                sample_products=product_list,
+                product_count=len(product_list),
+                timestamp=datetime.utcnow()
+            ).model_dump_json().encode()
+            etag = strong_etag(body)
+            await product_catalog.set_body(TEST_DB_BODY_KEY, body, etag, catalog_version)
+            return encoded_response(body, etag, cache_control=TEST_DB_CACHE_CONTROL)
 
     except Exception as e:
         logger.error(f"Database error: {e}")
@@ -219,7 +563,7 @@ async def test_database():
 @app.get("/test-redis", response_model=CacheTestResponse)
 async def test_redis():
     """Test Redis connection and basic operations"""
-    global redis_client
+    global redis_client, redis_batcher
 
     if not redis_client:
         raise HTTPException(
@@ -232,19 +576,19 @@ async def test_redis():
         test_key = f"test:api-gateway:{datetime.utcnow().timestamp()}"
         test_value = f"Hello from API Gateway at {datetime.utcnow().isoformat()}"
 
-        # Set value with TTL
-        redis_client.setex(test_key, 60, test_value)
-
-        # Get value back
-        retrieved_value = redis_client.get(test_key)
-        ttl = redis_client.ttl(test_key)
+        # Set with TTL and read back in a single round-trip
+        _, retrieved_value, ttl = await redis_batcher.execute(
+            ("SETEX", test_key, 60, test_value),
+            ("GET", test_key),
+            ("TTL", test_key)
+        )
 
         return CacheTestResponse(
             key=test_key,
             value=retrieved_value or "",
             ttl=ttl,
             operation="SET/GET",
-            timestamp=datetime.utcnow().isoformat()
+            timestamp=datetime.utcnow()
         )
 
     except Exception as e:
@@ -258,50 +602,44 @@ async def test_redis():
 @app.get("/test-http/{service}", response_model=ServiceCallResponse)
 async def test_http_call(service: str):
     """Test HTTP call to another service (for distributed tracing demo)"""
-    global http_client
-
-    if not http_client:
+    if not services.started:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="HTTP client not initialized"
         )
 
-    # Define service endpoints (these would be real services in production)
-    service_urls = {
-        "inventory": os.getenv("INVENTORY_SERVICE_URL", "http://inventory-service:8001"),
-        "pricing": os.getenv("PRICING_SERVICE_URL", "http://pricing-service:8002"),
-        "external": "https://httpbin.org/json"  # External service for testing
-    }
-
-    if service not in service_urls:
+    if service not in services:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Unknown service: {service}. Available: {list(service_urls.keys())}"
+            detail=f"Unknown service: {service}. Available: {services.names()}"
         )
+    downstream = services[service]
 
     try:
-        # Make HTTP call to the service
-        url = service_urls[service]
-
         # For demo purposes, if internal services aren't available, mock the response
         if service in ["inventory", "pricing"]:
-            # Try to call the actual service
+            # Try to call the actual service; an open circuit skips it entirely
             try:
-                response = await http_client.get(f"{url}/health", timeout=5.0)
+                response = await downstream.get("/health")
                 response_data = response.json()
                 call_status = "success"
-            except Exception:
-                # Mock response if service isn't running
+            except Exception as e:
+                if isinstance(e, CircuitOpen):
+                    reason = str(e)
+                else:
+                    reason = f"{type(e).__name__}: {e}"
+                    logger.warning(f"Call to {service} failed, returning mocked response: {reason}")
                 response_data = {
                     "mocked": True,
                     "service": service,
                     "message": f"Mocked response from {service}",
-                    "timestamp": datetime.utcnow().isoformat()
+                    "reason": reason,
+                    "timestamp": datetime.utcnow()
                 }
-                call_status = "mocked"
+                call_status = "circuit_open" if isinstance(e, CircuitOpen) else "mocked"
         else:
             # Call external service
-            response = await http_client.get(url)
+            response = await downstream.get("/json")
             response_data = response.json()
             call_status = "success"
 
@@ -309,9 +647,15 @@ async def test_http_call(service: str):
             target=service,
             status=call_status,
             data=response_data,
-            timestamp=datetime.utcnow().isoformat()
+            timestamp=datetime.utcnow()
         )
 
+    except CircuitOpen as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
     except Exception as e:
         logger.error(f"HTTP call error: {e}")
         raise HTTPException(
@@ -320,70 +664,111 @@ async def test_http_call(service: str):
         )
 
 
-@app.get("/products", response_model=Dict[str, Any])
-async def get_products(limit: int = 10):
-    """Get products with pricing (composite operation for tracing)"""
+def encode_cursor(sku: str) -> str:
+    """Build an opaque pagination cursor pointing just past the given SKU"""
+    raw = dumps({"sku": sku})
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """Return the SKU encoded in a cursor, or raise 400 if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sku = json.loads(base64.urlsafe_b64decode(padded))["sku"]
+        if not isinstance(sku, str):
+            raise ValueError("sku must be a string")
+        return sku
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+async def load_products_page(limit: int, after_sku: Optional[str], cache_key: str) -> Tuple[bytes, str, str]:
+    """Return (body, etag, cache status) for one page
+
+    The encoded body comes from Redis when a current one is cached there;
+    otherwise the page is assembled from per-product entries, encoded once,
+    and cached in both tiers unless it was built from a stale index.
+    """
+    body, etag, version = await product_catalog.get_body(cache_key)
+    if body is not None:
+        local_cache.set(cache_key, (body, etag), len(body))
+        return body, etag, "HIT"
+
+    page = await product_catalog.page(limit, after_sku)
+    next_after = page["next_after"]
+    body = ProductListResponse(
+        products=page["products"],
+        next_cursor=encode_cursor(next_after) if next_after else None,
+        stale=page["stale"],
+        timestamp=datetime.utcnow()
+    ).model_dump_json().encode()
+    etag = strong_etag(body)
+
+    if page["products"] and not page["stale"]:
+        local_cache.set(cache_key, (body, etag), len(body))
+        await product_catalog.set_body(cache_key, body, etag, version)
+    return body, etag, "MISS"
+
+
+@app.get("/products", response_model=ProductListResponse)
+async def get_products(
+    limit: int = 10,
+    after: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get products with pricing (composite operation for tracing)
+
+    Results are ordered by SKU. Pass the returned next_cursor as `after` to
+    fetch the following page; limit is capped at PRODUCTS_MAX_PAGE_SIZE.
+    Pages are served as cached, pre-encoded bodies; the X-Cache header says
+    which tier answered. A matching If-None-Match gets a 304 straight from
+    the cache, without touching PostgreSQL.
+    """
     global db_pool, redis_client
 
+    limit = max(1, min(limit, PRODUCTS_MAX_PAGE_SIZE))
+    after_sku = decode_cursor(after) if after else None
+
+    cache_key = f"products:list:{limit}"
+    if after_sku is not None:
+        cache_key = f"{cache_key}:after:{after_sku}"
+
+    # Try the in-process cache first (no network I/O, no re-encoding)
+    cached_page = local_cache.get(cache_key)
+    if cached_page is not None:
+        body, etag = cached_page
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag, PRODUCTS_CACHE_CONTROL)
+        return encoded_response(body, etag, "HIT-LOCAL")
+
+    # Revalidation: compare against the current ETag without loading the body
+    if if_none_match and product_catalog:
+        etag, _ = await product_catalog.get_etag(cache_key)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag, PRODUCTS_CACHE_CONTROL)
+
     result = {
         "products": [],
-        "source": "database",
-        "cached": False,
-        "timestamp": datetime.utcnow().isoformat()
+        "next_cursor": None,
+        "stale": False,
+        "timestamp": datetime.utcnow()
     }
 
-    # Try cache first
-    if redis_client:
-        try:
-            cache_key = f"products:list:{limit}"
-            cached_data = redis_client.get(cache_key)
-            if cached_data:
-                import json
-                result["products"] = json.loads(cached_data)
-                result["source"] = "cache"
-                result["cached"] = True
-                return result
-        except Exception as e:
-            logger.warning(f"Cache read failed: {e}")
-
-    # Fetch from database
-    if db_pool:
+    # Serve the cached body, or assemble the page from per-product entries;
+    # concurrent requests for the same page share one load. Without
+    # PostgreSQL, whatever Redis still holds is served before mock data
+    if product_catalog and (db_pool or redis_client):
         try:
-            async with db_pool.acquire() as conn:
-                products = await conn.fetch(
-                    "SELECT id, sku, name, stock_level, price "
-                    "FROM inventory.products "
-                    "LIMIT $1",
-                    limit
-                )
-
-                product_list = [
-                    {
-                        "id": str(p["id"]),
-                        "sku": p["sku"],
-                        "name": p["name"],
-                        "stock_level": p["stock_level"],
-                        "price": float(p["price"]) if p["price"] else 0,
-                        # Add mock pricing calculation
-                        "discounted_price": float(p["price"]) * 0.9 if p["price"] else 0
-                    }
-                    for p in products
-                ]
-
-                result["products"] = product_list
-
-                # Cache the result
-                if redis_client and product_list:
-                    try:
-                        import json
-                        cache_key = f"products:list:{limit}"
-                        redis_client.setex(
-                            cache_key,
-                            300,  # 5 minutes TTL
-                            json.dumps(product_list)
-                        )
-                    except Exception as e:
-                        logger.warning(f"Cache write failed: {e}")
+            body, etag, cache_status = await product_loads.do(
+                cache_key,
+                lambda: load_products_page(limit, after_sku, cache_key)
+            )
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag, PRODUCTS_CACHE_CONTROL)
+            return encoded_response(body, etag, cache_status)
 
         except Exception as e:
             logger.error(f"Database error: {e}")
@@ -399,7 +784,6 @@ async def get_products(limit: int = 10):
                 }
                 for i in range(1, min(limit + 1, 6))
             ]
-            result["source"] = "mock"
     else:
         # No database connection, return mock data
         result["products"] = [
@@ -413,52 +797,306 @@ async def get_products(limit: int = 10):
             }
             for i in range(1, min(limit + 1, 6))
         ]
-        result["source"] = "mock"
 
     return result
 
 
+EXPORT_COLUMNS = list(ProductResponse.model_fields)
+
+EXPORT_PRODUCTS = queries.register(
+    "export.products",
+    f"SELECT {PRODUCT_COLUMNS} "
+    "FROM inventory.products "
+    "ORDER BY sku"
+)
+
+
+async def stream_products(fmt: str) -> AsyncIterator[bytes]:
+    """Yield the whole catalog in EXPORT_PREFETCH-row chunks
+
+    Rows come from a server-side cursor inside a read-only repeatable-read
+    transaction, so the export is a consistent snapshot and only one chunk
+    is ever held in memory.
+    """
+    async with read_pool.acquire() as conn:
+        async with conn.transaction(readonly=True, isolation="repeatable_read"):
+            cursor = await EXPORT_PRODUCTS.cursor(conn)
+
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_COLUMNS)
+                yield buffer.getvalue().encode()
+
+            while True:
+                rows = await cursor.fetch(EXPORT_PREFETCH)
+                if not rows:
+                    break
+
+                if fmt == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    for p in rows:
+                        product = Product.from_record(p)
+                        writer.writerow([getattr(product, c) for c in EXPORT_COLUMNS])
+                    yield buffer.getvalue().encode()
+                else:
+                    yield "".join(
+                        ProductResponse.model_validate(Product.from_record(p)).model_dump_json() + "\n"
+                        for p in rows
+                    ).encode()
+
+
+@app.get("/products/export")
+async def export_products(format: str = "ndjson"):
+    """Stream the full product catalog as NDJSON (default) or CSV"""
+    global read_pool
+
+    if not read_pool:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database connection not available"
+        )
+
+    if format == "csv":
+        return StreamingResponse(
+            stream_products("csv"),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=products.csv"}
+        )
+    elif format == "ndjson":
+        return StreamingResponse(
+            stream_products("ndjson"),
+            media_type="application/x-ndjson"
+        )
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown export format: {format}. Available: ['ndjson', 'csv']"
+        )
+
+
+@app.get("/products/batch", response_model=ProductBatchResponse)
+async def get_products_batch(ids: str):
+    """Resolve a comma-separated list of product ids and/or SKUs
+
+    Each product is read from its own Redis entry in one pipelined
+    round-trip; only the ones missing from the cache are fetched from
+    PostgreSQL, in one query.
+    """
+    global db_pool, redis_client
+
+    refs = list(dict.fromkeys(ref.strip() for ref in ids.split(",") if ref.strip()))
+    if not refs:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one product id or SKU is required"
+        )
+    if len(refs) > PRODUCTS_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many products requested: {len(refs)} (max {PRODUCTS_BATCH_MAX})"
+        )
+
+    if not product_catalog or not db_pool:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database connection not available"
+        )
+
+    try:
+        found, cache_hits = await product_catalog.get_many(refs)
+    except Exception as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database query failed: {str(e)}"
+        )
+
+    return FastJSONResponse(ProductBatchResponse(
+        products=[found[ref] for ref in refs if ref in found],
+        missing=[ref for ref in refs if ref not in found],
+        requested=len(refs),
+        cache_hits=cache_hits,
+        timestamp=datetime.utcnow()
+    ))
+
+
+@app.get("/metrics", response_model=Dict[str, Any])
+async def get_metrics():
+    """Expose in-process cache and pool counters"""
+    return {
+        "service": "api-gateway",
+        "local_cache": local_cache.stats(),
+        "product_loads": product_loads.stats(),
+        "catalog": product_catalog.stats() if product_catalog else None,
+        "catalog_listener": catalog_listener.stats() if catalog_listener else None,
+        "redis_batching": redis_batcher.stats() if redis_batcher else None,
+        "reservation_reaper": reservation_reaper.stats() if reservation_reaper else None,
+        "postgres_pool": db_pool.stats() if db_pool else None,
+        "read_routing": read_pool.stats() if read_pool else None,
+        "downstreams": services.stats(),
+        "queries": queries.stats(),
+        "worker": {
+            "pid": os.getpid(),
+            "workers_per_pod": WORKER_COUNT,
+            "pool_sizes": {"postgres": DB_BUDGET.pool_size, "redis": REDIS_POOL_SIZE, "http": HTTP_POOL_SIZE},
+            "memory": memory_watchdog.stats() if memory_watchdog else None
+        },
+        "timestamp": datetime.utcnow()
+    }
+
+
+def simulated_step(delay: float):
+    """Build an order step that stands in for a downstream call"""
+    async def run(context: Dict[str, Any], results: Dict[str, Any]) -> None:
+        await asyncio.sleep(delay)  # Simulate processing time
+    return run
+
+
+async def inventory_check_step(context: Dict[str, Any], results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Look up the product and its unreserved stock"""
+    if not db_pool:
+        await asyncio.sleep(0.1)  # Simulate processing time
+        return None
+
+    product = await fetch_product(db_pool, context["product_id"])
+    if product["available"] < context["quantity"]:
+        raise InsufficientStock(
+            f"only {product['available']} of {product['sku']} available, "
+            f"{context['quantity']} requested"
+        )
+    return product
+
+
+async def stock_reservation_step(context: Dict[str, Any], results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Reserve stock against the version read by inventory_check"""
+    product = results["inventory_check"]
+    if product is None:
+        await asyncio.sleep(0.15)  # Simulate processing time
+        return None
+
+    reservation = await reserve_stock(
+        db_pool,
+        product,
+        context["quantity"],
+        context["order_id"],
+        RESERVATION_TTL,
+        RESERVATION_MAX_RETRIES
+    )
+    context["reservation"] = reservation
+    return reservation
+
+
+async def order_confirmation_step(context: Dict[str, Any], results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Commit the reservation: its units are sold and no longer expire
+
+    The sale lowers stock_level, so the product's cache entries are evicted
+    here rather than left to the change listener, which may be disabled or
+    reconnecting.
+    """
+    reservation = context.get("reservation")
+    if reservation is None:
+        await asyncio.sleep(0.05)  # Simulate processing time
+        return None
+    committed = await commit_reservation(db_pool, reservation)
+
+    pin_primary_reads()
+    try:
+        await product_catalog.invalidate([str(reservation["product_id"])])
+    except Exception as e:
+        # The sale stands; the entry expires after CACHE_TTL at the latest
+        logger.warning(f"Could not evict product {reservation['product_id']} after a sale: {e}")
+    on_catalog_change()
+    return committed
+
+
+# Order flow as a dependency graph: inventory and pricing are independent,
+# reservation needs the inventory check, payment needs a reservation and a
+# price, and confirmation turns the reservation into a sale
+ORDER_STEP_TIMEOUT = float(os.getenv("ORDER_STEP_TIMEOUT", 2.0))
+RESERVATION_TTL = float(os.getenv("RESERVATION_TTL", 900))
+RESERVATION_MAX_RETRIES = int(os.getenv("RESERVATION_MAX_RETRIES", 8))
+
+order_orchestrator = OrderOrchestrator([
+    OrderStep("inventory_check", inventory_check_step, timeout=ORDER_STEP_TIMEOUT),
+    OrderStep("price_calculation", simulated_step(0.05), timeout=ORDER_STEP_TIMEOUT),
+    OrderStep(
+        "stock_reservation",
+        stock_reservation_step,
+        depends_on=("inventory_check",),
+        timeout=ORDER_STEP_TIMEOUT
+    ),
+    OrderStep(
+        "payment_processing",
+        simulated_step(0.2),
+        depends_on=("price_calculation", "stock_reservation"),
+        timeout=ORDER_STEP_TIMEOUT
+    ),
+    OrderStep(
+        "order_confirmation",
+        order_confirmation_step,
+        depends_on=("payment_processing",),
+        timeout=ORDER_STEP_TIMEOUT
+    )
+])
+
+
 @app.post("/order", response_model=Dict[str, Any])
 async def create_order(product_id: str, quantity: int = 1):
-    """Create an order (demonstrates distributed transaction)"""
+    """Create an order (demonstrates distributed transaction)
 
-    # This is a simplified order creation that would normally:
-    # 1. Check inventory (call inventory service)
-    # 2. Calculate price (call pricing service)
-    # 3. Reserve stock
-    # 4. Process payment
-    # 5. Confirm order
+    Steps run concurrently wherever the dependency graph allows, so the
+    order takes roughly its critical path rather than the sum of all steps.
+    """
+    if quantity < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Quantity must be at least 1"
+        )
 
     order = {
-        "order_id": f"ORD-{datetime.utcnow().timestamp():.0f}",
+        "order_id": f"ORD-{datetime.utcnow().timestamp():.0f}-{uuid.uuid4().hex[:8]}",
         "product_id": product_id,
         "quantity": quantity,
         "status": "pending",
         "steps": []
     }
 
-    # Simulate service calls with some latency
-    steps = [
-        ("inventory_check", 0.1),
-        ("price_calculation", 0.05),
-        ("stock_reservation", 0.15),
-        ("payment_processing", 0.2),
-        ("order_confirmation", 0.05)
-    ]
+    try:
+        run = await order_orchestrator.run(order)
+    except OrderFailed as e:
+        # Give reserved stock back now instead of when the reaper finds it
+        reservation = order.get("reservation")
+        if reservation is not None and reservation.get("status") != "committed" and db_pool:
+            try:
+                await release_reservation(db_pool, reservation, f"Order failed at {e.step}")
+            except Exception as release_error:
+                logger.warning(
+                    f"Could not release reservation for {order['order_id']}; "
+                    f"the reaper will after RESERVATION_TTL: {release_error}"
+                )
 
-    for step_name, delay in steps:
-        await asyncio.sleep(delay)  # Simulate processing time
-        order["steps"].append({
-            "name": step_name,
-            "status": "completed",
-            "duration_ms": int(delay * 1000)
-        })
+        if isinstance(e.error, ProductNotFound):
+            status_code = status.HTTP_404_NOT_FOUND
+        elif isinstance(e.error, ReservationError):
+            status_code = status.HTTP_409_CONFLICT
+        elif e.timed_out:
+            status_code = status.HTTP_504_GATEWAY_TIMEOUT
+        else:
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+        logger.error(f"Order {order['order_id']} failed: {e}")
+        raise HTTPException(status_code=status_code, detail=str(e))
 
     order["status"] = "confirmed"
-    order["total_duration_ms"] = sum(s["duration_ms"] for s in order["steps"])
-    order["timestamp"] = datetime.utcnow().isoformat()
+    order["steps"] = run["steps"]
+    order["total_duration_ms"] = run["elapsed_ms"]
+    order["critical_path_ms"] = run["critical_path_ms"]
+    order["total_work_ms"] = run["total_work_ms"]
+    order["timestamp"] = datetime.utcnow()
 
-    return order
+    return FastJSONResponse(order)
 
 
 @app.get("/error-test/{error_type}")
@@ -493,6 +1131,8 @@ async def test_error(error_type: str):
         }
 
 
+# Single-process development runner; production runs several workers
+# with `gunicorn -c gunicorn.conf.py main:app`
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,103 @@
+"""
+In-process metrics for the API Gateway
+Fixed-bucket latency histograms reported through /metrics, and rolling
+windows for percentiles that must follow current behaviour
+"""
+
+import bisect
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+# Upper bounds in milliseconds; anything slower lands in the overflow bucket
+DEFAULT_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """Latency histogram with fixed bucket bounds (milliseconds)
+
+    observe() is a bisect and an increment, cheap enough for every pool
+    acquire or query. Percentiles are estimated as the upper bound of the
+    bucket they fall in, capped at the observed max.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        """Record one duration in milliseconds"""
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q: float) -> float:
+        """Estimated q-th percentile (0-100) in milliseconds; 0.0 when empty"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                bound = self.buckets[i] if i < len(self.buckets) else self.max_ms
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def stats(self) -> Dict[str, Any]:
+        """Summary plus cumulative bucket counts (Prometheus-style `le`)"""
+        cumulative: Dict[str, int] = {}
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            cumulative[f"le_{bound:g}"] = seen
+        cumulative["le_inf"] = self.count
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": cumulative
+        }
+
+
+class LatencyWindow:
+    """The most recent `size` latencies (milliseconds), for live percentiles
+
+    Unlike Histogram, old samples fall out, so percentiles track how a
+    dependency behaves now rather than since startup. Percentiles are exact
+    over the window; the sort is cached until the next observation.
+    """
+
+    def __init__(self, size: int = 256):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._sorted: Optional[List[float]] = None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, ms: float) -> None:
+        self._samples.append(ms)
+        self._sorted = None
+
+    def percentile(self, q: float) -> float:
+        """q-th percentile (0-100) of the window; 0.0 when empty"""
+        if not self._samples:
+            return 0.0
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        return self._sorted[min(len(self._sorted) - 1, int(q / 100 * len(self._sorted)))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self._samples),
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3)
+        }
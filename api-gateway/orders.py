@@ -0,0 +1,540 @@
+"""
+Order orchestration for the API Gateway
+Runs order steps as a dependency graph so independent steps overlap
+"""
+
+import time
+import uuid
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from database import queries
+
+logger = logging.getLogger(__name__)
+
+# A step receives the order context and the results of the steps it depends on
+StepFunc = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class OrderStep:
+    """One node in the order graph"""
+    name: str
+    run: StepFunc
+    depends_on: Tuple[str, ...] = ()
+    timeout: float = 2.0
+
+
+class OrderFailed(Exception):
+    """Raised when a step fails or times out; siblings have been cancelled"""
+
+    def __init__(
+        self,
+        step: str,
+        reason: str,
+        timed_out: bool,
+        steps: List[Dict[str, Any]],
+        error: Optional[Exception] = None
+    ):
+        super().__init__(f"Order step {step} {reason}")
+        self.step = step
+        self.reason = reason
+        self.timed_out = timed_out
+        self.steps = steps
+        self.error = error
+
+
+class ReservationError(Exception):
+    """Base class for stock reservation failures"""
+
+
+class ProductNotFound(ReservationError):
+    """No product matches the requested id or SKU"""
+
+
+class InsufficientStock(ReservationError):
+    """Available stock (stock_level - reserved_stock) is below the quantity"""
+
+
+class ReservationConflict(ReservationError):
+    """The product version kept changing under us for every retry"""
+
+
+class ReservationExpired(ReservationError):
+    """The reservation was already released (reaped) before it was committed"""
+
+
+class OrderOrchestrator:
+    """Execute order steps concurrently, respecting declared dependencies
+
+    Every step starts as soon as all of its dependencies have completed, in
+    a single asyncio.TaskGroup. A failure or timeout in any step cancels the
+    steps still running or waiting and surfaces as OrderFailed.
+    """
+
+    def __init__(self, steps: List[OrderStep]):
+        self.steps = self._topological_order(steps)
+
+    async def run(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the graph; returns per-step records plus timing summary"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        done = {step.name: asyncio.Event() for step in self.steps}
+        results: Dict[str, Any] = {}
+        records = {
+            step.name: {"name": step.name, "status": "pending", "duration_ms": 0}
+            for step in self.steps
+        }
+
+        async def execute(step: OrderStep) -> None:
+            for dependency in step.depends_on:
+                await done[dependency].wait()
+
+            record = records[step.name]
+            record["status"] = "running"
+            step_started = loop.time()
+            record["started_at_ms"] = int((step_started - started) * 1000)
+            try:
+                async with asyncio.timeout(step.timeout):
+                    results[step.name] = await step.run(context, results)
+            except TimeoutError:
+                record["status"] = "timed_out"
+                raise OrderFailed(step.name, f"timed out after {step.timeout}s", True, [])
+            except asyncio.CancelledError:
+                record["status"] = "cancelled"
+                raise
+            except Exception as e:
+                record["status"] = "failed"
+                raise OrderFailed(step.name, f"failed: {e}", False, [], e) from e
+            finally:
+                record["duration_ms"] = int((loop.time() - step_started) * 1000)
+
+            record["status"] = "completed"
+            done[step.name].set()
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for step in self.steps:
+                    group.create_task(execute(step))
+        except* OrderFailed as failures:
+            for record in records.values():
+                if record["status"] == "pending":
+                    record["status"] = "skipped"
+            first = failures.exceptions[0]
+            raise OrderFailed(
+                first.step,
+                first.reason,
+                first.timed_out,
+                [records[step.name] for step in self.steps],
+                first.error
+            ) from None
+
+        return {
+            "steps": [records[step.name] for step in self.steps],
+            "results": results,
+            "critical_path_ms": self._critical_path_ms(records),
+            "total_work_ms": sum(r["duration_ms"] for r in records.values()),
+            "elapsed_ms": int((loop.time() - started) * 1000)
+        }
+
+    def _critical_path_ms(self, records: Dict[str, Dict[str, Any]]) -> int:
+        """Longest chain of step durations through the dependency graph"""
+        finish: Dict[str, int] = {}
+        for step in self.steps:
+            ready = max((finish[d] for d in step.depends_on), default=0)
+            finish[step.name] = ready + records[step.name]["duration_ms"]
+        return max(finish.values(), default=0)
+
+    @staticmethod
+    def _topological_order(steps: List[OrderStep]) -> List[OrderStep]:
+        """Validate the graph and return steps ordered dependencies-first"""
+        by_name = {step.name: step for step in steps}
+        if len(by_name) != len(steps):
+            raise ValueError("Duplicate order step names")
+
+        ordered: List[OrderStep] = []
+        state: Dict[str, str] = {}
+
+        def visit(step: OrderStep) -> None:
+            if state.get(step.name) == "done":
+                return
+            if state.get(step.name) == "visiting":
+                raise ValueError(f"Dependency cycle at order step {step.name}")
+            state[step.name] = "visiting"
+            for dependency in step.depends_on:
+                if dependency not in by_name:
+                    raise ValueError(f"Order step {step.name} depends on unknown step {dependency}")
+                visit(by_name[dependency])
+            state[step.name] = "done"
+            ordered.append(step)
+
+        for step in steps:
+            visit(step)
+        return ordered
+
+
+# Looks up the product an order refers to, by primary key or by SKU
+FETCH_PRODUCT_BY_ID = queries.register(
+    "orders.fetch_product_by_id",
+    "SELECT id, sku, version, stock_level - reserved_stock AS available, price "
+    "FROM inventory.products "
+    "WHERE id = $1"
+)
+FETCH_PRODUCT_BY_SKU = queries.register(
+    "orders.fetch_product_by_sku",
+    "SELECT id, sku, version, stock_level - reserved_stock AS available, price "
+    "FROM inventory.products "
+    "WHERE sku = $1"
+)
+
+# Reserves stock and records the RESERVE transaction in one statement (one
+# round-trip, one implicit transaction). The UPDATE only applies if the row
+# still has the version we read and enough unreserved stock; when it does not,
+# the returned availability tells a version conflict from a stock shortfall.
+RESERVE_STOCK = queries.register("orders.reserve_stock", """
+WITH current_row AS (
+    SELECT id, stock_level - reserved_stock AS available
+    FROM inventory.products
+    WHERE id = $1
+), reserved AS (
+    UPDATE inventory.products
+    SET reserved_stock = reserved_stock + $2,
+        version = version + 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = $1
+      AND version = $3
+      AND stock_level - reserved_stock >= $2
+    RETURNING id, version
+), recorded AS (
+    INSERT INTO inventory.stock_transactions
+        (product_id, transaction_type, quantity, reference_id, expires_at)
+    SELECT id, 'RESERVE', $2, $4, CURRENT_TIMESTAMP + make_interval(secs => $5)
+    FROM reserved
+    RETURNING id, expires_at
+)
+SELECT
+    (SELECT id FROM recorded) AS transaction_id,
+    (SELECT expires_at FROM recorded) AS expires_at,
+    (SELECT version FROM reserved) AS new_version,
+    current_row.available AS available
+FROM current_row
+""")
+
+
+# Turns a held reservation into a sale: the RESERVE row stops expiring, the
+# units leave both stock_level and reserved_stock, and a SALE row records it.
+# Only a reservation still holding stock (expires_at set) qualifies; the row
+# lock makes this and the reaper or a release mutually exclusive, and the
+# recheck after the lock wait means whichever commits first wins.
+COMMIT_RESERVATION = queries.register("orders.commit_reservation", """
+WITH held AS (
+    SELECT id, product_id, quantity, reference_id
+    FROM inventory.stock_transactions
+    WHERE id = $1
+      AND transaction_type = 'RESERVE'
+      AND expires_at IS NOT NULL
+    FOR UPDATE
+), cleared AS (
+    UPDATE inventory.stock_transactions
+    SET expires_at = NULL
+    WHERE id IN (SELECT id FROM held)
+), sold AS (
+    UPDATE inventory.products
+    SET stock_level = stock_level - held.quantity,
+        reserved_stock = GREATEST(reserved_stock - held.quantity, 0),
+        version = version + 1,
+        updated_at = CURRENT_TIMESTAMP
+    FROM held
+    WHERE products.id = held.product_id
+), recorded AS (
+    INSERT INTO inventory.stock_transactions
+        (product_id, transaction_type, quantity, reference_id, notes)
+    SELECT product_id, 'SALE', quantity, reference_id, 'Order confirmed'
+    FROM held
+    RETURNING id
+)
+SELECT id AS transaction_id FROM recorded
+""")
+
+# Gives a held reservation back straight away (the order failed after the
+# stock was reserved), exactly as the reaper would once it expired
+RELEASE_RESERVATION = queries.register("orders.release_reservation", """
+WITH held AS (
+    SELECT id, product_id, quantity, reference_id
+    FROM inventory.stock_transactions
+    WHERE id = $1
+      AND transaction_type = 'RESERVE'
+      AND expires_at IS NOT NULL
+    FOR UPDATE
+), cleared AS (
+    UPDATE inventory.stock_transactions
+    SET expires_at = NULL
+    WHERE id IN (SELECT id FROM held)
+), released AS (
+    UPDATE inventory.products
+    SET reserved_stock = GREATEST(reserved_stock - held.quantity, 0),
+        version = version + 1,
+        updated_at = CURRENT_TIMESTAMP
+    FROM held
+    WHERE products.id = held.product_id
+), recorded AS (
+    INSERT INTO inventory.stock_transactions
+        (product_id, transaction_type, quantity, reference_id, notes)
+    SELECT product_id, 'RELEASE', quantity, reference_id, $2
+    FROM held
+    RETURNING id
+)
+SELECT id AS transaction_id FROM recorded
+""")
+
+
+async def fetch_product(pool: asyncpg.Pool, product_ref: str) -> Dict[str, Any]:
+    """Resolve an order's product reference (UUID or SKU) to its current row"""
+    try:
+        product_id = uuid.UUID(product_ref)
+    except ValueError:
+        product_id = None
+
+    async with pool.acquire() as conn:
+        if product_id is not None:
+            row = await FETCH_PRODUCT_BY_ID.fetchrow(conn, product_id)
+        else:
+            row = await FETCH_PRODUCT_BY_SKU.fetchrow(conn, product_ref)
+
+    if row is None:
+        raise ProductNotFound(f"product {product_ref} not found")
+    return dict(row)
+
+
+async def reserve_stock(
+    pool: asyncpg.Pool,
+    product: Dict[str, Any],
+    quantity: int,
+    reference_id: str,
+    ttl_seconds: float,
+    max_retries: int = 5
+) -> Dict[str, Any]:
+    """Reserve quantity units with optimistic concurrency on products.version
+
+    The happy path is one round-trip and no row lock outlives the single
+    statement. On a version conflict we back off, re-read the version and
+    retry, up to max_retries times.
+    """
+    expected_version = product["version"]
+    for attempt in range(max_retries + 1):
+        async with pool.acquire() as conn:
+            row = await RESERVE_STOCK.fetchrow(
+                conn,
+                product["id"],
+                quantity,
+                expected_version,
+                reference_id,
+                float(ttl_seconds)
+            )
+
+        if row is None:
+            raise ProductNotFound(f"product {product['sku']} not found")
+        if row["transaction_id"] is not None:
+            return {
+                "transaction_id": row["transaction_id"],
+                "product_id": product["id"],
+                "quantity": quantity,
+                "version": row["new_version"],
+                "expires_at": row["expires_at"],
+                "attempts": attempt + 1
+            }
+        if row["available"] < quantity:
+            raise InsufficientStock(
+                f"only {row['available']} of {product['sku']} available, {quantity} requested"
+            )
+
+        # Someone else updated the row first: back off with jitter so the
+        # contenders spread out, then re-read the version right before retrying
+        if attempt < max_retries:
+            await asyncio.sleep(random.uniform(0, min(0.05, 0.002 * (2 ** attempt))))
+            async with pool.acquire() as conn:
+                current = await FETCH_PRODUCT_BY_ID.fetchrow(conn, product["id"])
+            if current is None:
+                raise ProductNotFound(f"product {product['sku']} not found")
+            expected_version = current["version"]
+
+    raise ReservationConflict(
+        f"could not reserve {product['sku']} after {max_retries + 1} attempts"
+    )
+
+
+async def commit_reservation(pool: asyncpg.Pool, reservation: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a held reservation into a sale of its units
+
+    Raises ReservationExpired if the reservation is no longer held (the
+    reaper or a release got to it first); its stock is then not sold.
+    """
+    async with pool.acquire() as conn:
+        sale_id = await COMMIT_RESERVATION.fetchval(conn, reservation["transaction_id"])
+    if sale_id is None:
+        raise ReservationExpired(f"reservation {reservation['transaction_id']} is no longer held")
+    reservation["status"] = "committed"
+    reservation["expires_at"] = None
+    reservation["sale_transaction_id"] = sale_id
+    return reservation
+
+
+async def release_reservation(pool: asyncpg.Pool, reservation: Dict[str, Any], reason: str) -> bool:
+    """Return a held reservation's units to available stock now
+
+    Returns False if it was no longer held (already committed or reaped).
+    """
+    async with pool.acquire() as conn:
+        release_id = await RELEASE_RESERVATION.fetchval(conn, reservation["transaction_id"], reason)
+    if release_id is None:
+        return False
+    reservation["status"] = "released"
+    reservation["expires_at"] = None
+    return True
+
+
+# Releases one batch of expired reservations in a single statement. The order
+# flow commits (COMMIT_RESERVATION) or releases (RELEASE_RESERVATION) every
+# reservation it makes, so the reaper only cleans up after orders that never
+# reached either, e.g. a worker that died mid-order. SKIP
+# LOCKED lets several gateway replicas reap concurrently: each claims rows the
+# others have not locked. Two batches can still share products, so those rows
+# are locked in id order before the update; locking them in plan order could
+# deadlock two reapers. A released RESERVE row has its expires_at cleared
+# (dropping it out of idx_stock_transactions_expires_at range scans) and gets
+# a matching RELEASE audit row.
+RELEASE_EXPIRED_RESERVATIONS = queries.register("orders.release_expired_reservations", """
+WITH expired AS (
+    SELECT id, product_id, quantity, reference_id
+    FROM inventory.stock_transactions
+    WHERE transaction_type = 'RESERVE'
+      AND expires_at <= CURRENT_TIMESTAMP
+    ORDER BY expires_at
+    LIMIT $1
+    FOR UPDATE SKIP LOCKED
+), locked AS (
+    SELECT id
+    FROM inventory.products
+    WHERE id IN (SELECT product_id FROM expired)
+    ORDER BY id
+    FOR UPDATE
+), cleared AS (
+    UPDATE inventory.stock_transactions
+    SET expires_at = NULL
+    WHERE id IN (SELECT id FROM expired)
+), released AS (
+    UPDATE inventory.products
+    SET reserved_stock = GREATEST(reserved_stock - totals.quantity, 0),
+        version = version + 1,
+        updated_at = CURRENT_TIMESTAMP
+    FROM (
+        SELECT expired.product_id, SUM(expired.quantity) AS quantity
+        FROM expired
+        JOIN locked ON locked.id = expired.product_id
+        GROUP BY expired.product_id
+    ) AS totals
+    WHERE products.id = totals.product_id
+), audit AS (
+    INSERT INTO inventory.stock_transactions
+        (product_id, transaction_type, quantity, reference_id, notes)
+    SELECT product_id, 'RELEASE', quantity, reference_id, 'Reservation expired'
+    FROM expired
+)
+SELECT COUNT(*) AS reservations, COALESCE(SUM(quantity), 0) AS units
+FROM expired
+""")
+
+
+class ReservationReaper:
+    """Background task that returns expired reservations to available stock
+
+    A safety net, not part of the normal order flow: confirmed orders commit
+    their reservation and failed ones release it immediately; what is left
+    to expire belongs to orders interrupted before either could run.
+
+    Every interval it releases expired RESERVE rows batch_size at a time
+    until a batch comes back short, so a backlog drains in one run while
+    each statement stays small and short-lived.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, interval: float = 30.0, batch_size: int = 100):
+        self.pool = pool
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.runs = 0
+        self.batches = 0
+        self.released_reservations = 0
+        self.released_units = 0
+        self.errors = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_ms = 0.0
+        self.last_run_released = 0
+
+    def start(self) -> None:
+        """Start the reaper loop on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Cancel the reaper loop and wait for it to exit"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> int:
+        """Release every currently expired reservation; returns how many"""
+        started = time.perf_counter()
+        released = 0
+        while True:
+            async with self.pool.acquire() as conn:
+                row = await RELEASE_EXPIRED_RESERVATIONS.fetchrow(conn, self.batch_size)
+            self.batches += 1
+            released += row["reservations"]
+            self.released_reservations += row["reservations"]
+            self.released_units += row["units"]
+            if row["reservations"] < self.batch_size:
+                break
+
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_run_ms = (time.perf_counter() - started) * 1000
+        self.last_run_released = released
+        return released
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of reaper configuration and throughput counters"""
+        seconds = self.last_run_ms / 1000
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "runs": self.runs,
+            "batches": self.batches,
+            "released_reservations": self.released_reservations,
+            "released_units": self.released_units,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_run_ms": round(self.last_run_ms, 2),
+            "last_run_released": self.last_run_released,
+            "last_run_per_second": round(self.last_run_released / seconds, 1) if seconds else 0.0
+        }
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                released = await self.run_once()
+                if released:
+                    logger.info(f"Released {released} expired stock reservations")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Reservation reaper run failed: {e}")
+            await asyncio.sleep(self.interval)
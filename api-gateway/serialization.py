@@ -0,0 +1,43 @@
+"""
+JSON serialization for the API Gateway
+orjson-backed encoding used for every response body the gateway produces
+"""
+
+from uuid import UUID
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(value: Any) -> Any:
+    """Encode types orjson does not handle natively"""
+    if isinstance(value, Decimal):
+        return float(value)
+    # asyncpg returns its own uuid.UUID subclass, which orjson does not accept
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode to JSON bytes; datetimes, UUIDs and Decimals need no conversion"""
+    return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (the app's default response class)
+
+    Handlers that build plain dicts or already-validated models should
+    return this directly: FastAPI then skips re-validating against the
+    response_model and its generic encoder. Dicts are serialized with
+    native values (asyncpg UUIDs, NUMERIC Decimals, datetimes) in one pass;
+    models by pydantic's own serializer.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode()
+        return dumps(content)
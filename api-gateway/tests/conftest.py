@@ -0,0 +1,10 @@
+"""
+Shared pytest setup for the API Gateway tests
+Run from api-gateway/: python -m pytest tests/ -v
+"""
+
+import sys
+from pathlib import Path
+
+# Gateway modules live next to tests/, not in an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,105 @@
+"""In-process cache tier and load coalescing"""
+
+import asyncio
+
+import pytest
+
+from cache import LocalCache, SingleFlight
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_local_cache_evicts_least_recently_used_past_byte_cap():
+    cache = LocalCache(max_entries=100, max_bytes=300, ttl=60)
+    cache.set("a", "A", 100)
+    cache.set("b", "B", 100)
+    cache.set("c", "C", 100)
+    assert cache.get("a") == "A"  # "b" is now the least recently used
+
+    cache.set("d", "D", 100)
+
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["A", "C", "D"]
+    assert cache.stats()["bytes"] == 300
+    assert cache.evictions == 1
+
+
+def test_local_cache_evicts_past_entry_cap():
+    cache = LocalCache(max_entries=2, max_bytes=10_000, ttl=60)
+    for key in ("a", "b", "c"):
+        cache.set(key, key, 1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_local_cache_skips_oversized_values_without_flushing():
+    cache = LocalCache(max_entries=100, max_bytes=300, ttl=60)
+    cache.set("a", "A", 100)
+    cache.set("a", "huge", 301)
+    cache.set("b", "huge", 301)
+    assert cache.get("a") is None  # the stale value is not left behind
+    assert cache.get("b") is None
+    assert cache.evictions == 0
+
+
+def test_local_cache_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LocalCache(ttl=5.0, clock=clock)
+    cache.set("page", "body", 4)
+    cache.set("short", "body", 4, ttl=1.0)
+
+    clock.now += 1.0
+    assert cache.get("short") is None
+    assert cache.get("page") == "body"
+
+    clock.now += 4.0
+    assert cache.get("page") is None
+    assert cache.expirations == 2
+    assert cache.stats()["bytes"] == 0
+
+
+def test_single_flight_coalesces_concurrent_loads():
+    flight = SingleFlight()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return calls
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("key", load) for _ in range(10)))
+        again = await flight.do("key", load)
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert results == [1] * 10
+    assert again == 2  # a finished load is not cached
+    assert flight.stats() == {"in_flight": 0, "loads": 2, "coalesced": 9}
+
+
+def test_single_flight_shares_exceptions_and_survives_cancelled_callers():
+    flight = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.02)
+        raise RuntimeError("database down")
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", load))
+        second = asyncio.ensure_future(flight.do("key", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(RuntimeError):
+            await second
+        assert first.cancelled()
+
+    asyncio.run(main())
+    assert flight.stats()["in_flight"] == 0
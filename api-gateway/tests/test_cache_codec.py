@@ -0,0 +1,59 @@
+"""Cache codec envelope: header, version checks and cross-format decoding"""
+
+import itertools
+
+import pytest
+
+from cache_codec import ENVELOPE_VERSION, HEADER, CacheCodec, CodecError, available_formats
+
+SERIALIZERS, COMPRESSIONS = available_formats()
+ENTRY = ["b18076c3-8ac0-4700-b41f-b1b17a9618eb", "LAPTOP-001", "ThinkPad X1 Carbon", 50, "1299.99"]
+
+
+def format_params(names, available):
+    return [
+        pytest.param(name, marks=pytest.mark.skipif(name not in available, reason=f"{name} not installed"))
+        for name in names
+    ]
+
+
+@pytest.mark.parametrize("compression", format_params(["none", "zlib", "lz4"], COMPRESSIONS))
+@pytest.mark.parametrize("serializer", format_params(["json", "orjson", "msgpack"], SERIALIZERS))
+def test_round_trip_through_the_envelope(serializer, compression):
+    codec = CacheCodec(serializer, compression, compress_min_bytes=0)
+    data = codec.encode(ENTRY)
+
+    assert HEADER.unpack_from(data)[0] == ENVELOPE_VERSION
+    assert (codec.serializer, codec.compression) == (serializer, compression)
+    assert codec.decode(data) == ENTRY
+
+
+def test_small_payloads_are_stored_uncompressed():
+    codec = CacheCodec("json", "zlib", compress_min_bytes=1024)
+    data = codec.encode(ENTRY)
+    assert HEADER.unpack_from(data)[2] == 0
+    assert codec.decode(data) == ENTRY
+
+
+def test_any_reader_decodes_what_any_writer_wrote():
+    codecs = [CacheCodec(s, c, compress_min_bytes=0) for s, c in itertools.product(SERIALIZERS, COMPRESSIONS)]
+    for writer, reader in itertools.product(codecs, repeat=2):
+        assert reader.decode(writer.encode(ENTRY)) == ENTRY
+
+
+def test_unknown_format_falls_back_to_json_uncompressed():
+    codec = CacheCodec("pickle", "brotli")
+    assert codec.describe()["serializer"] == "json"
+    assert codec.describe()["compression"] == "none"
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"\x01", "too short"),
+    (HEADER.pack(ENVELOPE_VERSION + 1, 1, 0) + b"[]", "envelope version"),
+    (HEADER.pack(ENVELOPE_VERSION, 99, 0) + b"[]", "Unsupported"),
+    (HEADER.pack(ENVELOPE_VERSION, 1, 1) + b"not zlib", "Corrupt"),
+    (HEADER.pack(ENVELOPE_VERSION, 1, 0) + b"{not json", "Corrupt"),
+])
+def test_unreadable_payloads_raise_codec_error(data, message):
+    with pytest.raises(CodecError, match=message):
+        CacheCodec().decode(data)
@@ -0,0 +1,241 @@
+"""Product catalog: pages from the SKU index, lookups by id or SKU, change notifications"""
+
+import json
+import time
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+from decimal import Decimal
+
+import fakeredis
+import fakeredis.aioredis
+
+from catalog import FIRST_PAGE, INDEX_ENTRIES, LOAD_PRODUCTS, NEXT_PAGE, CatalogChangeListener, ProductCatalog
+
+
+class FakeConnection:
+    """Answers the catalog's registered queries from a list of rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, sql, *args, timeout=None):
+        by_sku = sorted(self.rows, key=lambda row: row["sku"].encode())
+        if sql == INDEX_ENTRIES.sql:
+            return by_sku
+        if sql == FIRST_PAGE.sql:
+            return by_sku[:args[0]]
+        if sql == NEXT_PAGE.sql:
+            return [row for row in by_sku if row["sku"].encode() > args[1].encode()][:args[0]]
+        if sql == LOAD_PRODUCTS.sql:
+            ids, skus = args
+            return [row for row in self.rows if row["id"] in ids or row["sku"] in skus]
+        raise AssertionError(f"unexpected query {sql}")
+
+
+class FakePool:
+    def __init__(self, skus):
+        self.rows = [
+            {"id": uuid.uuid4(), "sku": sku, "name": f"Product {sku}", "stock_level": 10, "price": Decimal("9.99")}
+            for sku in skus
+        ]
+        self.queries = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.queries += 1
+        yield FakeConnection(self.rows)
+
+    def row(self, sku):
+        return next(row for row in self.rows if row["sku"] == sku)
+
+
+def run(skus, scenario):
+    pool = FakePool(skus)
+
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        catalog = ProductCatalog(pool, redis)
+        try:
+            await scenario(catalog, pool)
+        finally:
+            await catalog.close()
+            await redis.aclose()
+
+    asyncio.run(main())
+
+
+def test_pages_walk_the_catalog_in_byte_order():
+    async def scenario(catalog, pool):
+        seen = []
+        after = None
+        while True:
+            page = await catalog.page(2, after)
+            seen += [product.sku for product in page["products"]]
+            after = page["next_after"]
+            if after is None:
+                break
+        assert seen == ["B", "C", "a", "b", "é"]
+        assert catalog.index_rebuilds == 1
+
+        queries = pool.queries
+        again = await catalog.page(2)
+        assert [product.sku for product in again["products"]] == ["B", "C"]
+        assert pool.queries == queries  # index and items both served from Redis
+        assert not again["stale"]
+
+    run(["b", "C", "é", "B", "a"], scenario)
+
+
+def test_get_many_resolves_ids_and_skus_and_reports_cache_hits():
+    async def scenario(catalog, pool):
+        await catalog.page(10)  # warms the index, SKU hash and items
+        a_id = str(pool.row("A")["id"])
+
+        found, cache_hits = await catalog.get_many([a_id, "B", "NOPE"])
+        assert found[a_id].sku == "A"
+        assert found["B"].sku == "B"
+        assert "NOPE" not in found
+        assert cache_hits == 2
+
+    run(["A", "B"], scenario)
+
+
+def test_invalidate_reloads_only_the_changed_product():
+    async def scenario(catalog, pool):
+        await catalog.page(10)
+        row = pool.row("A")
+        row["stock_level"] = 3
+        await catalog.invalidate([str(row["id"])])
+
+        queries = pool.queries
+        page = await catalog.page(10)
+        assert [product.stock_level for product in page["products"]] == [3, 10]
+        assert pool.queries == queries + 1
+
+    run(["A", "B"], scenario)
+
+
+def test_renamed_sku_is_not_returned_under_its_old_sku():
+    async def scenario(catalog, pool):
+        await catalog.page(10)
+        row = pool.row("B")
+        row["sku"] = "B2"
+        await catalog.invalidate([str(row["id"])])
+        await catalog.invalidate_index()
+
+        found, _ = await catalog.get_many(["B", "B2"])
+        assert "B" not in found
+        assert found["B2"].id == str(row["id"])
+
+    run(["A", "B"], scenario)
+
+
+def test_stale_sku_hash_entry_falls_back_to_a_lookup_by_sku():
+    async def scenario(catalog, pool):
+        await catalog.page(10)
+        # B and C swap SKUs; only the items are evicted, the SKU hash is stale
+        b, c = pool.row("B"), pool.row("C")
+        b["sku"], c["sku"] = "C", "B"
+        await catalog.invalidate([str(b["id"]), str(c["id"])])
+
+        found, _ = await catalog.get_many(["B", "C", "A"])
+        assert found["B"].id == str(c["id"])
+        assert found["C"].id == str(b["id"])
+        assert found["A"].sku == "A"
+
+    run(["A", "B", "C"], scenario)
+
+
+class RecordingCatalog:
+    """Stands in for ProductCatalog; records what the listener evicts"""
+
+    def __init__(self, fail=0):
+        self.evicted = []
+        self.reindexed = 0
+        self.fail = fail
+
+    async def invalidate(self, product_ids):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("redis down")
+        self.evicted.append(sorted(product_ids))
+
+    async def invalidate_index(self):
+        self.reindexed += 1
+
+
+def change(product_id, **extra):
+    return json.dumps({"id": product_id, "at": time.time(), **extra})
+
+
+def test_listener_skips_malformed_payloads_and_evicts_the_rest():
+    catalog = RecordingCatalog()
+    callbacks = []
+    listener = CatalogChangeListener("postgresql://unused", catalog, on_invalidate=lambda: callbacks.append(1))
+
+    payloads = ["{}", "not json", "[]", "null", json.dumps({"id": "x"}), change("p1"), change("p2"), change("p1")]
+    asyncio.run(listener._apply(payloads))
+
+    assert catalog.evicted == [["p1", "p2"]]
+    assert catalog.reindexed == 0
+    assert callbacks == [1]
+    stats = listener.stats()
+    assert stats["malformed"] == 5
+    assert stats["notifications"] == 3
+
+
+def test_listener_pins_before_evicting_and_clears_l1_after():
+    catalog = RecordingCatalog()
+    events = []
+    listener = CatalogChangeListener(
+        "postgresql://unused",
+        catalog,
+        before_invalidate=lambda: events.append(("pin", list(catalog.evicted))),
+        on_invalidate=lambda: events.append(("clear", list(catalog.evicted)))
+    )
+
+    asyncio.run(listener._apply([change("p1")]))
+
+    assert events == [("pin", []), ("clear", [["p1"]])]
+
+
+def test_listener_reindexes_when_a_change_asks_for_it():
+    catalog = RecordingCatalog()
+    listener = CatalogChangeListener("postgresql://unused", catalog)
+
+    asyncio.run(listener._apply([change("p1"), change("p2", reindex=True)]))
+
+    assert catalog.evicted == [["p1", "p2"]]
+    assert catalog.reindexed == 1
+
+
+def test_listener_ignores_a_batch_of_only_malformed_payloads():
+    catalog = RecordingCatalog()
+    callbacks = []
+    listener = CatalogChangeListener("postgresql://unused", catalog, on_invalidate=lambda: callbacks.append(1))
+
+    asyncio.run(listener._apply(["{}", "null"]))
+
+    assert catalog.evicted == []
+    assert callbacks == []
+
+
+def test_apply_loop_survives_a_failed_batch():
+    catalog = RecordingCatalog(fail=1)
+    listener = CatalogChangeListener("postgresql://unused", catalog)
+
+    async def main():
+        task = asyncio.create_task(listener._apply_loop())
+        listener._queue.put_nowait(change("p1"))
+        await asyncio.sleep(0.01)
+        listener._queue.put_nowait(change("p2"))
+        await asyncio.sleep(0.01)
+        alive = not task.done()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return alive
+
+    assert asyncio.run(main())
+    assert catalog.evicted == [["p2"]]
+    assert listener.errors == 1
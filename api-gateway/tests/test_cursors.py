@@ -0,0 +1,27 @@
+"""Keyset pagination cursors for GET /products"""
+
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+from main import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("sku", ["LAPTOP-001", "", "a/b+c=d", "Ünïcödé-ß", "x" * 200])
+def test_cursor_round_trip(sku):
+    cursor = encode_cursor(sku)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == sku
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(b'{"id": "LAPTOP-001"}').decode(),
+    base64.urlsafe_b64encode(b'{"sku": 42}').decode(),
+])
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as info:
+        decode_cursor(cursor)
+    assert info.value.status_code == 400
@@ -0,0 +1,23 @@
+"""PostgreSQL connection budget and pool sizing"""
+
+from database import ConnectionBudget
+
+
+def test_pool_size_splits_budget_across_replicas_and_workers():
+    budget = ConnectionBudget(total=100, replicas=3, workers=4)
+    assert budget.processes == 12
+    assert budget.pool_size == 8
+    assert not budget.oversubscribed
+
+
+def test_reserved_connections_come_out_of_each_share():
+    budget = ConnectionBudget(total=100, replicas=1, workers=4, reserved=1)
+    assert budget.pool_size == 24
+    assert (budget.pool_size + budget.reserved) * budget.processes <= budget.total
+
+
+def test_pool_size_never_drops_below_one():
+    budget = ConnectionBudget(total=10, replicas=4, workers=4, reserved=1)
+    assert budget.pool_size == 1
+    assert budget.oversubscribed
+    assert budget.stats()["oversubscribed"] is True
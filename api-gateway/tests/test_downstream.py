@@ -0,0 +1,190 @@
+"""Downstream resilience: circuit breaker states and adaptive timeouts"""
+
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from downstream import CLOSED, HALF_OPEN, OPEN, AdaptiveTimeout, CircuitBreaker, CircuitOpen, Downstream, HedgePolicy
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def breaker(**overrides):
+    settings = dict(window=10, min_calls=4, failure_rate=0.5, slow_call_ms=100, open_seconds=10, half_open_calls=2)
+    settings.update(overrides)
+    return CircuitBreaker("inventory", **settings)
+
+
+def open_breaker(cb):
+    for _ in range(cb.min_calls):
+        cb.record(False, 5, cb.allow())
+    assert cb.state == OPEN
+
+
+def test_stays_closed_below_min_calls_and_failure_rate(clock):
+    cb = breaker()
+    for _ in range(3):
+        cb.record(False, 5, cb.allow())
+    assert cb.state == CLOSED  # all failed, but fewer than min_calls
+
+    cb = breaker()
+    for ok in [True] * 5 + [False] * 3:
+        cb.record(ok, 5, cb.allow())
+    assert cb.state == CLOSED  # 3 of 8 failed
+    assert cb.stats()["failure_rate"] == 0.375
+
+
+def test_opens_on_failure_rate_and_fails_fast(clock):
+    cb = breaker()
+    open_breaker(cb)
+
+    clock[0] += 9.0
+    with pytest.raises(CircuitOpen) as info:
+        cb.allow()
+    assert info.value.retry_after == pytest.approx(1.0)
+    assert cb.rejected == 1
+    assert cb.opened == 1
+
+
+def test_opens_on_slow_call_rate(clock):
+    cb = breaker(slow_call_rate=0.5)
+    for _ in range(4):
+        cb.record(True, 500, cb.allow())
+    assert cb.state == OPEN
+
+
+def test_half_open_admits_limited_trials_then_closes(clock):
+    cb = breaker()
+    open_breaker(cb)
+
+    clock[0] += 10.0
+    first, second = cb.allow(), cb.allow()
+    assert cb.state == HALF_OPEN
+    assert first and second
+    with pytest.raises(CircuitOpen):
+        cb.allow()  # only half_open_calls trials at a time
+
+    cb.record(True, 5, first)
+    assert cb.state == HALF_OPEN
+    cb.record(True, 5, second)
+    assert cb.state == CLOSED
+    assert cb.stats()["window_calls"] == 0
+    assert cb.allow() is False
+
+
+def test_failed_or_slow_trial_reopens(clock):
+    for outcome in [(False, 5), (True, 500)]:
+        cb = breaker()
+        open_breaker(cb)
+        clock[0] += 10.0
+        cb.record(*outcome, cb.allow())
+        assert cb.state == OPEN
+        assert cb.opened == 2
+
+
+def test_released_trial_frees_its_slot(clock):
+    cb = breaker(half_open_calls=1)
+    open_breaker(cb)
+    clock[0] += 10.0
+
+    trial = cb.allow()
+    with pytest.raises(CircuitOpen):
+        cb.allow()
+    cb.release(trial)
+    assert cb.allow() is True
+    assert cb.state == HALF_OPEN
+
+
+class FakePool:
+    """Answers after `latency_ms`, or times out like httpx past the timeout"""
+
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+        self.error = None
+
+    def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get(self, url, timeout, **kwargs):
+        if self.error:
+            raise self.error
+        if self.latency_ms / 1000 > timeout:
+            await asyncio.sleep(timeout)
+            raise httpx.ReadTimeout("timed out")
+        await asyncio.sleep(self.latency_ms / 1000)
+        return httpx.Response(200)
+
+
+def test_adaptive_timeout_widens_after_latency_shifts_up():
+    timeout = AdaptiveTimeout(maximum=1.0, minimum=0.02, min_samples=5, window=50)
+    pool = FakePool(latency_ms=1)
+    service = Downstream("pricing", ["http://pricing"], timeout, pool=pool)
+
+    async def call(n):
+        failed = 0
+        for _ in range(n):
+            try:
+                await service.get("/health")
+            except httpx.TimeoutException:
+                failed += 1
+        return failed
+
+    async def main():
+        assert await call(20) == 0
+        # Ratcheted down towards the 20 ms minimum, well below what comes next
+        assert timeout.current() < 0.1
+
+        pool.latency_ms = 100
+        shift_failures = await call(10)
+        assert shift_failures > 0
+        # 20 -> 40 -> 80 -> 160 ms: a handful of timeouts, then calls succeed again
+        assert await call(20) == 0
+        return shift_failures
+
+    shift_failures = asyncio.run(main())
+    assert shift_failures <= 5
+    assert service.timeouts == shift_failures
+    assert timeout.current() >= 0.1
+
+
+def test_pool_timeouts_do_not_widen_the_timeout():
+    timeout = AdaptiveTimeout(maximum=1.0, minimum=0.005, min_samples=1)
+    timeout.observe(1)
+    pool = FakePool(latency_ms=1)
+    pool.error = httpx.PoolTimeout("no free connection")
+    service = Downstream("pricing", ["http://pricing"], timeout, pool=pool)
+
+    with pytest.raises(httpx.PoolTimeout):
+        asyncio.run(service.get("/health"))
+    assert len(timeout.latency) == 1
+    assert service.timeouts == 1
+
+
+def test_primary_that_loses_to_its_hedge_is_censored_at_the_timeout():
+    timeout = AdaptiveTimeout(maximum=1.0, minimum=0.2, min_samples=20)
+    for _ in range(20):
+        timeout.observe(5)
+    pool = FakePool(latency_ms=5)
+    service = Downstream("pricing", ["http://a", "http://b"], timeout, hedging=HedgePolicy(), pool=pool)
+
+    async def slow_first_endpoint(url, request_timeout, **kwargs):
+        await asyncio.sleep(0.5 if url.startswith("http://a") else 0.005)
+        return httpx.Response(200)
+
+    pool.get = slow_first_endpoint
+    response = asyncio.run(service.get("/health"))
+
+    assert response.status_code == 200
+    assert service.hedging.hedge_wins == 1
+    # Not the ~10 ms the primary had run for, which would hide the stall
+    assert timeout.latency.percentile(100) == 200.0
@@ -0,0 +1,51 @@
+"""ETags and If-None-Match handling for GET /products"""
+
+import pytest
+
+from main import etag_matches, strong_etag
+
+ETAG = '"abc123"'
+
+
+def test_strong_etag_depends_on_exact_bytes():
+    body = b'{"products": []}'
+    assert strong_etag(body) == strong_etag(body)
+    assert strong_etag(body) != strong_etag(b'{"products": [] }')
+    assert strong_etag(body).startswith('"') and strong_etag(body).endswith('"')
+
+
+@pytest.mark.parametrize("if_none_match", [
+    '"abc123"',
+    ' "abc123" ',
+    'W/"abc123"',
+    '"other", "abc123"',
+    '"other",W/"abc123" , "third"',
+    "*",
+    " * ",
+])
+def test_matches(if_none_match):
+    assert etag_matches(if_none_match, ETAG)
+
+
+def test_weak_comparison_applies_to_our_etag_too():
+    assert etag_matches('"abc123"', 'W/"abc123"')
+    assert etag_matches('W/"abc123"', 'W/"abc123"')
+
+
+@pytest.mark.parametrize("if_none_match", [
+    '"abc1234"',
+    '"ABC123"',
+    "abc123",
+    '"other", "another"',
+    '"abc123"x',
+    "",
+    None,
+])
+def test_does_not_match(if_none_match):
+    assert not etag_matches(if_none_match, ETAG)
+
+
+@pytest.mark.parametrize("etag", [None, ""])
+def test_missing_etag_never_matches(etag):
+    assert not etag_matches("*", etag)
+    assert not etag_matches('"abc123"', etag)
@@ -0,0 +1,104 @@
+"""Order orchestrator: concurrency, cancellation, timeouts and critical path"""
+
+import asyncio
+
+import pytest
+
+from orders import OrderFailed, OrderOrchestrator, OrderStep
+
+
+def sleeper(seconds, result=None, log=None, name=None):
+    async def run(context, results):
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append(name)
+            raise
+        return result
+    return run
+
+
+async def failing(context, results):
+    await asyncio.sleep(0.01)
+    raise RuntimeError("payment declined")
+
+
+def test_independent_steps_overlap_and_dependents_see_results():
+    seen = {}
+
+    async def confirm(context, results):
+        seen.update(results)
+        return "confirmed"
+
+    orchestrator = OrderOrchestrator([
+        OrderStep("confirm", confirm, depends_on=("inventory", "payment")),
+        OrderStep("inventory", sleeper(0.05, "in stock")),
+        OrderStep("payment", sleeper(0.05, "paid")),
+    ])
+    run = asyncio.run(orchestrator.run({}))
+
+    assert [step["name"] for step in run["steps"]] == ["inventory", "payment", "confirm"]
+    assert seen == {"inventory": "in stock", "payment": "paid"}
+    assert run["results"]["confirm"] == "confirmed"
+    # Both 50 ms steps ran side by side; one after the other takes >= 100 ms
+    assert run["elapsed_ms"] < 100
+
+
+def test_failure_cancels_running_siblings_and_skips_dependents():
+    cancelled = []
+    orchestrator = OrderOrchestrator([
+        OrderStep("inventory", sleeper(1.0, log=cancelled, name="inventory")),
+        OrderStep("payment", failing),
+        OrderStep("confirm", sleeper(0), depends_on=("inventory", "payment")),
+    ])
+
+    with pytest.raises(OrderFailed) as info:
+        asyncio.run(orchestrator.run({}))
+
+    error = info.value
+    statuses = {step["name"]: step["status"] for step in error.steps}
+    assert error.step == "payment"
+    assert not error.timed_out
+    assert isinstance(error.error, RuntimeError)
+    assert cancelled == ["inventory"]
+    assert statuses == {"inventory": "cancelled", "payment": "failed", "confirm": "skipped"}
+
+
+def test_step_timeout_fails_the_order():
+    orchestrator = OrderOrchestrator([
+        OrderStep("inventory", sleeper(1.0), timeout=0.05),
+        OrderStep("payment", sleeper(1.0)),
+    ])
+
+    with pytest.raises(OrderFailed) as info:
+        asyncio.run(orchestrator.run({}))
+
+    statuses = {step["name"]: step["status"] for step in info.value.steps}
+    assert info.value.step == "inventory"
+    assert info.value.timed_out
+    assert statuses == {"inventory": "timed_out", "payment": "cancelled"}
+
+
+def test_critical_path_is_the_longest_dependency_chain():
+    orchestrator = OrderOrchestrator([
+        OrderStep("a", sleeper(0)),
+        OrderStep("b", sleeper(0), depends_on=("a",)),
+        OrderStep("c", sleeper(0)),
+    ])
+    records = {
+        "a": {"duration_ms": 30},
+        "b": {"duration_ms": 20},
+        "c": {"duration_ms": 40},
+    }
+    assert orchestrator._critical_path_ms(records) == 50
+
+
+def test_invalid_graphs_are_rejected():
+    step = sleeper(0)
+    with pytest.raises(ValueError):
+        OrderOrchestrator([OrderStep("a", step), OrderStep("a", step)])
+    with pytest.raises(ValueError):
+        OrderOrchestrator([OrderStep("a", step, depends_on=("b",)), OrderStep("b", step, depends_on=("a",))])
+    with pytest.raises(ValueError):
+        OrderOrchestrator([OrderStep("a", step, depends_on=("missing",))])
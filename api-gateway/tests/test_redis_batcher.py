@@ -0,0 +1,85 @@
+"""Pipelined and auto-batched Redis commands"""
+
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from redis.exceptions import ResponseError
+
+from cache import RedisBatcher, raw
+
+
+def run(scenario, **settings):
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        batcher = RedisBatcher(redis, **settings)
+        try:
+            return await scenario(redis, batcher)
+        finally:
+            await batcher.close()
+            await redis.aclose()
+
+    return asyncio.run(main())
+
+
+def test_execute_pipelines_commands_and_keeps_raw_replies_undecoded():
+    async def scenario(redis, batcher):
+        replies = await batcher.execute(("SET", "k", "v"), ("GET", "k"), raw("GET", "k"), ("GET", "missing"))
+        assert replies == [True, "v", b"v", None]
+        assert batcher.stats()["round_trips"] == 1
+
+    run(scenario)
+
+
+def test_auto_batch_splits_one_round_trip_back_to_each_caller():
+    async def scenario(redis, batcher):
+        results = await asyncio.gather(
+            batcher.execute(("SET", "a", "1"), ("GET", "a")),
+            batcher.execute(("INCR", "n"),),
+            batcher.execute(("INCR", "n"), ("INCR", "n"), ("GET", "n")),
+        )
+        assert results == [[True, "1"], [1], [2, 3, "3"]]
+        stats = batcher.stats()
+        assert stats["calls"] == 3
+        assert stats["round_trips"] == 1
+        assert stats["largest_batch"] == 6
+
+    run(scenario, auto_batch=True, window=0.01)
+
+
+def test_auto_batch_error_only_fails_the_caller_that_sent_it():
+    async def scenario(redis, batcher):
+        await redis.set("text", "not a number")
+        good, bad, other = await asyncio.gather(
+            batcher.execute(("SET", "a", "1"),),
+            batcher.execute(("GET", "a"), ("INCR", "text")),
+            batcher.execute(("GET", "a"),),
+            return_exceptions=True
+        )
+        assert good == [True]
+        assert isinstance(bad, ResponseError)
+        assert other == ["1"]
+        assert batcher.round_trips == 1
+
+    run(scenario, auto_batch=True, window=0.01)
+
+
+def test_auto_batch_flushes_at_max_batch_without_waiting():
+    async def scenario(redis, batcher):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        replies = await asyncio.gather(*(batcher.execute(("INCR", "n"), ("INCR", "n")) for _ in range(2)))
+        assert loop.time() - started < 1.0  # the 10s window never elapsed
+        assert sorted(replies) == [[1, 2], [3, 4]]
+
+    run(scenario, auto_batch=True, window=10.0, max_batch=4)
+
+
+def test_pipeline_error_is_raised_without_auto_batch():
+    async def scenario(redis, batcher):
+        await redis.set("text", "x")
+        with pytest.raises(ResponseError):
+            await batcher.execute(("INCR", "text"), ("GET", "text"))
+
+    run(scenario)
@@ -0,0 +1,14 @@
+"""Per-worker pool sizing"""
+
+from workers import pool_share
+
+
+def test_pool_share_splits_budget_across_workers():
+    assert pool_share(20, 4) == 5
+    assert pool_share(20, 0) == 20
+    assert pool_share(20, 4, reserved=1) == 4
+
+
+def test_pool_share_never_drops_below_one():
+    assert pool_share(3, 4) == 1
+    assert pool_share(4, 4, reserved=1) == 1
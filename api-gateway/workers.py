@@ -0,0 +1,150 @@
+"""
+Process model for the API Gateway
+CPU-quota detection and connection budgeting for the multi-worker launcher
+(gunicorn.conf.py), and the memory watchdog that recycles a bloated worker
+"""
+
+import os
+import math
+import time
+import random
+import signal
+import asyncio
+import logging
+import resource
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# cgroup v2 exposes "<quota> <period>" in one file; v1 splits them
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CPU_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_CPU_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit() -> float:
+    """CPUs this process may use: the cgroup quota if set, else usable cores
+
+    A Kubernetes `limits.cpu: 500m` shows up here as 0.5 even though the
+    node reports all of its cores.
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return min(cores, int(quota) / int(period))
+        return float(cores)
+
+    quota, period = _read(CGROUP_V1_CPU_QUOTA), _read(CGROUP_V1_CPU_PERIOD)
+    if quota and period and int(quota) > 0:
+        return min(cores, int(quota) / int(period))
+    return float(cores)
+
+
+def auto_workers(min_workers: int = 2, max_workers: int = 0) -> int:
+    """Worker count for the CPU quota: one per (partial) CPU
+
+    At least min_workers, so one worker can be recycled while another keeps
+    serving; max_workers caps it (0 = no cap).
+    """
+    workers = max(min_workers, math.ceil(cpu_limit()))
+    return min(workers, max_workers) if max_workers else workers
+
+
+def pool_share(budget: int, workers: int, reserved: int = 0) -> int:
+    """Per-worker pool size so `workers` pools stay within `budget` connections
+
+    `reserved` connections per worker are held outside the pool (e.g. the
+    LISTEN connection) and come out of the same share. Never below 1.
+    """
+    return max(1, budget // max(1, workers) - reserved)
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    statm = _read("/proc/self/statm")
+    if statm:
+        return int(statm.split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    # No procfs: fall back to the peak RSS (KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if peak > 1 << 32 else peak * 1024
+
+
+class MemoryWatchdog:
+    """Gracefully restart this worker once its RSS exceeds a limit
+
+    Checks every interval seconds (jittered, so workers started together do
+    not all recycle in the same moment); over the limit it sends SIGTERM to its
+    own process, which makes uvicorn stop accepting, finish in-flight
+    requests and run the lifespan shutdown. The process manager (gunicorn)
+    then starts a fresh worker while the others keep serving.
+    """
+
+    def __init__(self, limit_bytes: int, interval: float = 10.0):
+        self.limit_bytes = limit_bytes
+        self.interval = interval
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.started_at = time.time()
+        self.checks = 0
+        self.peak_rss_bytes = 0
+        self.recycling = False
+
+    def start(self) -> None:
+        """Start the watchdog loop on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Cancel the watchdog loop and wait for it to exit"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def check(self) -> bool:
+        """Sample RSS; request a graceful restart if over the limit"""
+        rss = rss_bytes()
+        self.checks += 1
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+        if rss <= self.limit_bytes or self.recycling:
+            return False
+
+        self.recycling = True
+        logger.warning(
+            f"Worker {os.getpid()} RSS {rss / 2**20:.0f} MiB exceeds "
+            f"{self.limit_bytes / 2**20:.0f} MiB; restarting gracefully"
+        )
+        os.kill(os.getpid(), signal.SIGTERM)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of this worker's memory against its limit"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "rss_bytes": rss_bytes(),
+            "limit_bytes": self.limit_bytes,
+            "interval_seconds": self.interval,
+            "checks": self.checks,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "recycling": self.recycling
+        }
+
+    async def _loop(self) -> None:
+        while not self.recycling:
+            await asyncio.sleep(self.interval * random.uniform(0.5, 1.5))
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"Memory watchdog check failed: {e}")
@@ -27,7 +27,7 @@ CREATE TABLE IF NOT EXISTS products (
 CREATE TABLE IF NOT EXISTS stock_transactions (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     product_id UUID NOT NULL REFERENCES products(id),
-    transaction_type VARCHAR(50) NOT NULL, -- RESERVE, RELEASE, ADJUSTMENT
+    transaction_type VARCHAR(50) NOT NULL, -- RESERVE, RELEASE, SALE, ADJUSTMENT
     quantity INTEGER NOT NULL,
     reference_id VARCHAR(255), -- Order ID or other reference
     notes TEXT,
@@ -37,11 +37,74 @@ CREATE TABLE IF NOT EXISTS stock_transactions (
 
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_products_sku ON products(sku);
+CREATE INDEX IF NOT EXISTS idx_products_sku_c ON products(sku COLLATE "C"); -- keyset pagination in byte order
 CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
 CREATE INDEX IF NOT EXISTS idx_stock_transactions_product_id ON stock_transactions(product_id);
 CREATE INDEX IF NOT EXISTS idx_stock_transactions_reference_id ON stock_transactions(reference_id);
 CREATE INDEX IF NOT EXISTS idx_stock_transactions_expires_at ON stock_transactions(expires_at);
 
+-- Change notifications for cache invalidation
+-- The API Gateway LISTENs on inventory_changes (CHANGE_CHANNEL in
+-- api-gateway/catalog.py; rename both together) and evicts only the products
+-- named in each payload. Updates that touch none of the cached columns
+-- (e.g. reserved_stock/version bumps from reservations) are not announced.
+CREATE OR REPLACE FUNCTION notify_product_change() RETURNS trigger AS $$
+DECLARE
+    row_data RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := OLD;
+    ELSE
+        row_data := NEW;
+    END IF;
+
+    IF TG_OP = 'UPDATE'
+       AND NEW.sku IS NOT DISTINCT FROM OLD.sku
+       AND NEW.name IS NOT DISTINCT FROM OLD.name
+       AND NEW.stock_level IS NOT DISTINCT FROM OLD.stock_level
+       AND NEW.price IS NOT DISTINCT FROM OLD.price THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM pg_notify('inventory_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'id', row_data.id,
+        -- Inserts, deletes and SKU changes reorder the SKU index
+        'reindex', TG_OP <> 'UPDATE' OR NEW.sku IS DISTINCT FROM OLD.sku,
+        'at', extract(epoch FROM clock_timestamp())
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_stock_transaction() RETURNS trigger AS $$
+BEGIN
+    -- Only adjustments change stock_level here; reservations and releases do
+    -- not, and a SALE updates products, whose own trigger announces it
+    IF NEW.transaction_type = 'ADJUSTMENT' THEN
+        PERFORM pg_notify('inventory_changes', json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'id', NEW.product_id,
+            'reindex', false,
+            'at', extract(epoch FROM clock_timestamp())
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_notify_change ON products;
+CREATE TRIGGER products_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION notify_product_change();
+
+DROP TRIGGER IF EXISTS stock_transactions_notify_change ON stock_transactions;
+CREATE TRIGGER stock_transactions_notify_change
+    AFTER INSERT ON stock_transactions
+    FOR EACH ROW EXECUTE FUNCTION notify_stock_transaction();
+
 -- Sample seed data for development
 INSERT INTO products (sku, name, description, category, stock_level, price) VALUES
     ('LAPTOP-001', 'ThinkPad X1 Carbon', 'Business laptop with 14" display', 'Electronics', 50, 1299.99),